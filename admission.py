@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Contrôle d'admission des générations pour Histoires Magiques
+Avant de créer une histoire (un appel OpenAI et un appel ElevenLabs) :
+- un seau à jetons par utilisateur et un par plan (free, starter, family),
+  partagés entre les workers gunicorn via la table SQLite rate_buckets ;
+- une profondeur maximale de la file des textes à générer.
+Un refus est immédiat (429 avec Retry-After) au lieu d'empiler les requêtes.
+Le nombre d'appels IA simultanés (worker + flux SSE) est plafonné par
+LLM_MAX_IN_FLIGHT, vérifié par jobs.py au moment de prendre un texte.
+"""
+
+import math
+import os
+import time
+
+import db
+
+# (capacité, jetons rendus par heure) : par utilisateur, puis pour tout le plan
+PLAN_LIMITS = {
+    'free': {'user': (2, 3), 'plan': (30, int(os.environ.get('ADMISSION_FREE_TIER_PER_HOUR', 120)))},
+    'starter': {'user': (5, 20), 'plan': (60, 600)},
+    'family': {'user': (10, 40), 'plan': (120, 1200)},
+}
+
+LLM_MAX_IN_FLIGHT = int(os.environ.get('LLM_MAX_IN_FLIGHT', 6))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 40))
+# Délai conseillé quand la file est pleine
+QUEUE_RETRY_AFTER = 30
+
+# Textes en attente de génération : travaux en file, texte ni écrit ni en cours
+PENDING_TEXT_SQL = "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND text_status = 'pending'"
+
+
+def _refill(row, capacity, per_hour, now):
+    if row is None:
+        return capacity
+    tokens, updated_at = row
+    return min(capacity, tokens + (now - updated_at) * per_hour / 3600)
+
+
+def _buckets(user_id, plan):
+    """(clé, capacité, jetons par heure) des deux seaux concernés"""
+    limits = PLAN_LIMITS.get(plan, PLAN_LIMITS['free'])
+    return [(f'user:{user_id}',) + limits['user'], (f'plan:{plan}',) + limits['plan']]
+
+
+def admit(user_id, plan):
+    """Décide si une génération peut être mise en file ; retourne un dict
+    {'allowed', 'reason' ('queue' ou 'rate'), 'retry_after' (s), 'queue_depth'}"""
+    buckets = _buckets(user_id, plan)
+    now = time.time()
+
+    with db.transaction(immediate=True) as conn:
+        queue_depth = conn.execute(PENDING_TEXT_SQL).fetchone()[0]
+        if queue_depth >= ADMISSION_MAX_QUEUE:
+            return {'allowed': False, 'reason': 'queue', 'retry_after': QUEUE_RETRY_AFTER,
+                    'queue_depth': queue_depth}
+
+        levels = []
+        retry_after = 0
+        for key, capacity, per_hour in buckets:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = _refill(row, capacity, per_hour, now)
+            if tokens < 1:
+                retry_after = max(retry_after, (1 - tokens) * 3600 / per_hour)
+            levels.append((key, tokens))
+        if retry_after:
+            return {'allowed': False, 'reason': 'rate', 'retry_after': math.ceil(retry_after),
+                    'queue_depth': queue_depth}
+
+        # Les deux seaux acceptent : un jeton est pris dans chacun
+        conn.executemany('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         [(key, tokens - 1, now) for key, tokens in levels])
+    return {'allowed': True, 'reason': None, 'retry_after': 0, 'queue_depth': queue_depth}
+
+
+def refund(user_id, plan):
+    """Rend le jeton pris par admit() quand l'histoire n'a finalement pas été créée
+    (crédits insuffisants, envoi en double)"""
+    now = time.time()
+    with db.transaction(immediate=True) as conn:
+        for key, capacity, per_hour in _buckets(user_id, plan):
+            row = conn.execute('SELECT tokens, updated_at FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens = min(capacity, _refill(row, capacity, per_hour, now) + 1)
+            conn.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+
+
+def llm_calls_in_flight(conn):
+    """Textes en cours de génération (worker ou flux SSE), dans la transaction conn"""
+    return conn.execute("""SELECT COUNT(*) FROM jobs
+                           WHERE status IN ('running', 'streaming') AND text_status != 'done'""").fetchone()[0]
+
+
+def llm_slot_available(conn):
+    return llm_calls_in_flight(conn) < LLM_MAX_IN_FLIGHT
+
+
+def queue_position(job):
+    """Rang du texte à générer dans la file (1 = le prochain), ou None s'il n'attend pas"""
+    if not job or job['status'] != 'queued' or job['text_status'] != 'pending':
+        return None
+    return db.query_one(PENDING_TEXT_SQL + ' AND id <= ?', (job['id'],))[0]
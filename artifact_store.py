@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Stockage des fichiers générés (PDF, MP3) pour Histoires Magiques
+Adressage par contenu : la clé d'un fichier est le SHA-256 de ses octets,
+un même fichier n'est donc écrit qu'une seule fois.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+ARTIFACT_BACKEND = os.environ.get('ARTIFACT_BACKEND', 'filesystem')
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', 'artifacts')
+
+
+class FilesystemBackend:
+    """Fichiers rangés par préfixe de hash : ab/cd/abcd...ef.pdf"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def commit(self, key, tmp_path, content_type=None):
+        """Déplace atomiquement un fichier temporaire vers son emplacement final"""
+        final_path = self.path_for(key)
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        os.replace(tmp_path, final_path)
+
+    def local_path(self, key):
+        return self.path_for(key)
+
+
+class LocalObjectStoreBackend:
+    """Object store local (bucket monté type MinIO/S3) : objets à plat + métadonnées JSON"""
+
+    def __init__(self, root, bucket='histoires'):
+        self.root = os.path.join(os.path.abspath(root), bucket)
+        self.tmp_dir = os.path.join(self.root, '.uploads')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path_for(self, key):
+        return os.path.join(self.root, key)
+
+    def exists(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def commit(self, key, tmp_path, content_type=None):
+        final_path = self.path_for(key)
+        meta = {
+            'content_type': content_type,
+            'size': os.path.getsize(tmp_path),
+            'created_at': datetime.utcnow().isoformat()
+        }
+        os.replace(tmp_path, final_path)
+        with open(final_path + '.json', 'w') as f:
+            json.dump(meta, f)
+
+    def local_path(self, key):
+        return self.path_for(key)
+
+
+BACKENDS = {
+    'filesystem': FilesystemBackend,
+    'object_store': LocalObjectStoreBackend
+}
+
+
+class ArtifactStore:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def put_stream(self, chunks, ext, content_type=None):
+        """Écrit un flux d'octets en calculant son hash au passage, retourne la clé"""
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(dir=self.backend.tmp_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        f.write(chunk)
+            key = f'{digest.hexdigest()}.{ext}'
+            if self.backend.exists(key):
+                os.remove(tmp_path)
+            else:
+                self.backend.commit(key, tmp_path, content_type)
+            return key
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def put_bytes(self, data, ext, content_type=None):
+        return self.put_stream([data], ext, content_type)
+
+    def exists(self, key):
+        return bool(key) and self.backend.exists(key)
+
+    def local_path(self, key):
+        return self.backend.local_path(key)
+
+
+def etag_for(key):
+    """Le hash de contenu sert directement d'ETag"""
+    return key.split('.', 1)[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Retourne le store configuré (un par processus)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                backend_class = BACKENDS.get(ARTIFACT_BACKEND, FilesystemBackend)
+                _store = ArtifactStore(backend_class(ARTIFACT_DIR))
+    return _store
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Assets statiques fingerprintés pour Histoires Magiques
+Au build (python assets.py), chaque source de static/ listée dans ASSETS est
+copiée dans static/dist/ sous un nom contenant son hash (pages.<hash>.css) et
+pré-compressée en gzip et brotli (paquet Brotli de requirements_final.txt). Ces fichiers
+ne changent jamais : ils sont servis avec un cache navigateur « immutable ».
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+from flask import abort, request, send_file, url_for
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# Sources à fingerprinter (chemins relatifs à static/)
+ASSETS = ['css/pages.css']
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_manifest = None
+
+
+def fingerprint(filename, data):
+    root, ext = os.path.splitext(filename)
+    return f'{root}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build():
+    """Génère les fichiers fingerprintés et compressés, puis le manifeste"""
+    manifest = {}
+    for filename in ASSETS:
+        with open(os.path.join(STATIC_DIR, filename), 'rb') as f:
+            data = f.read()
+        target = fingerprint(filename, data)
+        target_path = os.path.join(DIST_DIR, target)
+        if not os.path.exists(target_path):
+            _write(target_path, data)
+        if not os.path.exists(target_path + '.gz'):
+            _write(target_path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        # Variante brotli ajoutée aussi aux builds faits avant l'installation du paquet
+        if brotli and not os.path.exists(target_path + '.br'):
+            _write(target_path + '.br', brotli.compress(data, quality=11))
+        manifest[filename] = target
+    _write(MANIFEST_PATH, json.dumps(manifest, indent=2).encode('utf-8'))
+    return manifest
+
+
+def load_manifest():
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH) as f:
+                _manifest = json.load(f)
+        except (OSError, ValueError):
+            # Pas encore construit (environnement de dev) : on construit à la volée
+            _manifest = build()
+    return _manifest
+
+
+def asset_url(filename):
+    """Équivalent de url_for('static', filename=...) qui renvoie le nom fingerprinté"""
+    target = load_manifest().get(filename)
+    if not target:
+        return url_for('static', filename=filename)
+    return url_for('assets', filename=target)
+
+
+def serve_asset(filename):
+    path = safe_join(DIST_DIR, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for candidate, ext in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[candidate] and os.path.isfile(path + ext):
+            path, encoding = path + ext, candidate
+            break
+
+    response = send_file(path, mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def init_app(app):
+    global _manifest
+    app.add_url_rule('/assets/<path:filename>', 'assets', serve_asset)
+    app.jinja_env.globals['asset_url'] = asset_url
+    if app.debug:
+        # En développement les sources changent : reconstruire à chaque démarrage
+        _manifest = build()
+    load_manifest()
+
+
+if __name__ == '__main__':
+    for source, target in build().items():
+        print(f'{source} -> dist/{target}')
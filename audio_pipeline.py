@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Synthèse vocale par morceaux pour Histoires Magiques
+L'histoire est découpée aux paragraphes puis aux phrases, chaque morceau est
+synthétisé en parallèle (pool de threads borné, partagé par le processus) et
+les trames MP3 sont mises bout à bout dans l'ordre, sans réencodage.
+Un morceau en échec est repris seul (reprises de tts_client) ; un morceau
+déjà synthétisé avec la même voix vient du cache (tts_cache.py). Le premier
+morceau, plus court, est publié dès qu'il est prêt comme aperçu écoutable
+(cache disque borné, oublié par le travail une fois l'audio complet écrit).
+"""
+
+import hashlib
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tts_cache
+from disk_cache import DiskLRUCache
+
+logger = logging.getLogger('histoires.audio')
+
+AUDIO_CHUNK_CHARS = int(os.environ.get('AUDIO_CHUNK_CHARS', 1000))
+AUDIO_FIRST_CHUNK_CHARS = int(os.environ.get('AUDIO_FIRST_CHUNK_CHARS', 250))
+AUDIO_SYNTH_CONCURRENCY = int(os.environ.get('AUDIO_SYNTH_CONCURRENCY', 3))
+AUDIO_PREVIEW_DIR = os.environ.get('AUDIO_PREVIEW_DIR', '.audio_previews')
+AUDIO_PREVIEW_MAX_MB = int(os.environ.get('AUDIO_PREVIEW_MAX_MB', 50))
+# Taille des lectures lors de l'assemblage
+READ_SIZE = 64 * 1024
+
+# Fin de phrase, éventuellement suivie d'un guillemet fermant
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+|(?<=[.!?…][»”"])\s+')
+
+# Débits (kbit/s) et fréquences des trames MPEG Layer III, par version
+_BITRATES_V1 = (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320)
+_BITRATES_V2 = (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+_executor = None
+_executor_lock = threading.Lock()
+_previews = None
+_previews_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=AUDIO_SYNTH_CONCURRENCY, thread_name_prefix='tts')
+    return _executor
+
+
+def get_previews():
+    """Aperçus (premiers morceaux) : cache disque borné, jamais dans le stockage permanent"""
+    global _previews
+    with _previews_lock:
+        if _previews is None:
+            _previews = DiskLRUCache(AUDIO_PREVIEW_DIR, AUDIO_PREVIEW_MAX_MB * 1024 * 1024, ext='.mp3')
+        return _previews
+
+
+def preview_path(key):
+    """Fichier de l'aperçu, ou None s'il a été évincé"""
+    return get_previews().get(key) if key else None
+
+
+def _pieces(paragraph, max_chars):
+    """Paragraphe trop long : phrases, et mots pour une phrase trop longue"""
+    if len(paragraph) <= max_chars:
+        return [paragraph]
+    pieces = []
+    for sentence in SENTENCE_END.split(paragraph):
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(' ', 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            pieces.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if sentence:
+            pieces.append(sentence)
+    return pieces
+
+
+def split_text(text, max_chars=AUDIO_CHUNK_CHARS, first_chars=AUDIO_FIRST_CHUNK_CHARS):
+    """Morceaux d'au plus max_chars caractères (first_chars pour le premier), coupés
+    entre paragraphes de préférence, sinon entre phrases"""
+    paragraphs = [block.strip() for block in re.split(r'\n\s*\n', (text or '').replace('\r\n', '\n'))]
+    chunks = []
+    current = ''
+    for paragraph in filter(None, paragraphs):
+        for index, piece in enumerate(_pieces(paragraph, first_chars if not chunks else max_chars)):
+            separator = ' ' if index else '\n\n'
+            limit = first_chars if not chunks else max_chars
+            if current and len(current) + len(separator) + len(piece) > limit:
+                chunks.append(current)
+                current = piece
+            else:
+                current = current + separator + piece if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _frame_length(header):
+    """Longueur d'une trame MPEG Layer III d'après son en-tête, ou None"""
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 3
+    layer = (header[1] >> 1) & 3
+    bitrate_index = header[2] >> 4
+    rate_index = (header[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    padding = (header[2] >> 1) & 1
+    if version == 3:
+        return 144000 * _BITRATES_V1[bitrate_index] // _SAMPLE_RATES[3][rate_index] + padding
+    return 72000 * _BITRATES_V2[bitrate_index] // _SAMPLE_RATES[version][rate_index] + padding
+
+
+def audio_range(f):
+    """(début, fin) des trames audio du fichier MP3 f : balises ID3v2/ID3v1 et trame
+    d'information Xing/Info/VBRI exclues (elles décriraient le morceau seul et non le
+    fichier assemblé). Seuls l'en-tête et la fin du fichier sont lus."""
+    end = f.seek(0, os.SEEK_END)
+    start = 0
+    while end - start >= 10:
+        f.seek(start)
+        header = f.read(10)
+        if header[:3] != b'ID3':
+            break
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        footer = 10 if header[5] & 0x10 else 0
+        start += 10 + size + footer
+    if end - start >= 128:
+        f.seek(end - 128)
+        if f.read(3) == b'TAG':
+            end -= 128
+
+    f.seek(start)
+    head = f.read(44)
+    length = _frame_length(head[:4])
+    if length and start + length <= end:
+        if b'Xing' in head[4:] or b'Info' in head[4:] or b'VBRI' in head[4:]:
+            start += length
+    return start, max(start, end)
+
+
+def read_frames(f):
+    """Trames audio du fichier f, par blocs de READ_SIZE octets"""
+    start, end = audio_range(f)
+    f.seek(start)
+    while start < end:
+        block = f.read(min(READ_SIZE, end - start))
+        if not block:
+            break
+        start += len(block)
+        yield block
+
+
+def _publish_preview(f, on_preview):
+    # Deux lectures du premier morceau (hash, puis copie) plutôt qu'une copie en mémoire
+    digest = hashlib.sha256()
+    for block in read_frames(f):
+        digest.update(block)
+    key = digest.hexdigest()
+    get_previews().write_file(key, lambda out: out.writelines(read_frames(f)))
+    on_preview(key)
+
+
+def _close_result(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+def _synthesize_chunk(text, voice):
+    # Passage déjà synthétisé (même texte, même voix) : servi par le cache disque
+    return tts_cache.synthesize_file(text, **voice)
+
+
+def synthesize_story(text, store, on_preview=None, **voice):
+    """Synthétise l'histoire par morceaux et écrit le MP3 assemblé dans le store.
+
+    Chaque morceau est écrit sur disque (cache des synthèses) et relu au moment
+    de l'assemblage : la mémoire utilisée ne dépend pas de la longueur de l'histoire.
+    on_preview(clé) reçoit le premier morceau dès qu'il est prêt, quand il y en a plusieurs.
+    voice : voice_id, model_id, voice_settings transmis à tts_cache.
+    Retourne la clé du MP3 complet, ou None si le texte est vide ; TTSError si un morceau échoue.
+    """
+    chunks = split_text(text)
+    if not chunks:
+        return None
+    executor = get_executor()
+    futures = [executor.submit(_synthesize_chunk, chunk, voice) for chunk in chunks]
+    try:
+        first = futures[0].result()
+        if on_preview and len(futures) > 1:
+            try:
+                _publish_preview(first, on_preview)
+            except Exception:
+                logger.warning('Aperçu audio non publié', exc_info=True)
+
+        def frames():
+            for future in futures:
+                yield from read_frames(future.result())
+
+        return store.put_stream(frames(), 'mp3', 'audio/mpeg')
+    except Exception:
+        # Morceaux encore en attente : inutile de les synthétiser
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        # Fichiers ouverts par les morceaux, y compris ceux qui finiront après un échec
+        for future in futures:
+            future.add_done_callback(_close_result)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Compression des réponses HTTP pour Histoires Magiques
+Middleware WSGI : négocie brotli (paquet Brotli, sinon gzip seul) ou gzip,
+compresse en flux sans tout garder en mémoire, et laisse passer les
+réponses déjà compressées (pages en cache pré-compressées, PDF .gz, CSS)
+ou incompressibles (MP3, PDF). Une réponse compressée à la volée perd
+Accept-Ranges et son ETag devient faible.
+"""
+
+import gzip
+import os
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 500))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/css', 'text/plain', 'application/json',
+                      'application/javascript', 'text/javascript', 'image/svg+xml')
+# Les PDF ne sont pas compressés ici : send_download sert leur copie .gz préparée une fois (gzip_path)
+# Le flux SSE doit partir mot à mot : la compression le retiendrait en tampon
+EXCLUDED_TYPES = ('text/event-stream', 'audio/', 'video/', 'image/png', 'image/jpeg')
+
+
+def negotiate(accept_encoding):
+    """Meilleur encodage accepté par le client : 'br', 'gzip' ou None"""
+    accepted = parse_accept_header(accept_encoding or '')
+    if brotli and accepted['br'] > 0:
+        return 'br'
+    if accepted['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def gzip_path(path, min_gain=0.05):
+    """Copie gzip du fichier (path + '.gz'), créée une seule fois ; None si la compression
+    ne fait pas gagner au moins min_gain (les PDF fpdf2 sont déjà en partie compressés)"""
+    gz_path = path + '.gz'
+    if not os.path.exists(gz_path):
+        tmp_path = f'{gz_path}.{os.getpid()}.tmp'
+        with open(path, 'rb') as src, open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(src.read(), compresslevel=9, mtime=0))
+        os.replace(tmp_path, gz_path)
+    if os.path.getsize(gz_path) > os.path.getsize(path) * (1 - min_gain):
+        return None
+    return gz_path
+
+
+def _compressor(encoding):
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        return compressor.process, compressor.finish
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _weak_etag(value):
+    return value if value.startswith('W/') else 'W/' + value
+
+
+def _should_compress(status, headers):
+    code = int(status.split(' ', 1)[0])
+    if code < 200 or code in (204, 206, 304):
+        return False
+    values = {name.lower(): value for name, value in headers}
+    if 'content-encoding' in values or 'content-range' in values:
+        return False
+    content_type = values.get('content-type', '').split(';')[0].strip().lower()
+    if content_type.startswith(EXCLUDED_TYPES) or content_type not in COMPRESSIBLE_TYPES:
+        return False
+    length = values.get('content-length')
+    if length is not None and int(length) < COMPRESSION_MIN_SIZE:
+        return False
+    return True
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        encoding = negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        if not encoding or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        state = {'compress': False}
+
+        def _start_response(status, headers, exc_info=None):
+            if _should_compress(status, headers):
+                state['compress'] = True
+                vary = [value for name, value in headers if name.lower() == 'vary']
+                # Corps différent de la ressource : plus de reprise par plage, ETag faible
+                headers = [(name, _weak_etag(value) if name.lower() == 'etag' else value)
+                           for name, value in headers
+                           if name.lower() not in ('content-length', 'vary', 'accept-ranges')]
+                headers.append(('Content-Encoding', encoding))
+                headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, _start_response)
+        if not state['compress']:
+            return app_iter
+        return self._stream(app_iter, encoding)
+
+    def _stream(self, app_iter, encoding):
+        process, finish = _compressor(encoding)
+        try:
+            for chunk in app_iter:
+                data = process(chunk)
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
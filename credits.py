@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Réservation des crédits d'histoires pour Histoires Magiques
+Un crédit est réservé avant la génération, par un UPDATE conditionnel
+(credits > 0) dans la même transaction que la création de l'histoire :
+deux onglets ou un double-clic ne peuvent pas dépenser le même crédit.
+La réservation est confirmée quand le travail se termine, et rendue si la
+génération échoue ou si seul le texte de secours a pu être servi.
+
+Chaque formulaire porte une clé d'idempotence : un second envoi du même
+formulaire renvoie vers l'histoire déjà en cours au lieu d'en créer une.
+"""
+
+import sqlite3
+
+import db
+
+# Seul le plan gratuit consomme des crédits ; les autres sont réservés pour 0
+CREDIT_PLANS = ('free',)
+MAX_KEY_LENGTH = 64
+
+
+class InsufficientCredits(Exception):
+    pass
+
+
+class DuplicateSubmission(Exception):
+    pass
+
+
+def clean_key(value):
+    """Clé d'idempotence reçue du formulaire, ou None si absente ou invalide"""
+    value = (value or '').strip()
+    if not value or len(value) > MAX_KEY_LENGTH:
+        return None
+    return value
+
+
+def find_story(user_id, idempotency_key):
+    """Histoire déjà créée pour cette clé, ou None"""
+    if not idempotency_key:
+        return None
+    row = db.query_one('SELECT story_id FROM credit_reservations WHERE user_id = ? AND idempotency_key = ?',
+                       (user_id, idempotency_key))
+    return row[0] if row else None
+
+
+def reserve(conn, user_id, plan, idempotency_key=None):
+    """Réserve un crédit dans la transaction conn ; retourne l'id de la réservation"""
+    amount = 1 if plan in CREDIT_PLANS else 0
+    try:
+        reservation_id = conn.execute('''INSERT INTO credit_reservations (user_id, idempotency_key, amount)
+                                         VALUES (?, ?, ?)''', (user_id, idempotency_key, amount)).lastrowid
+    except sqlite3.IntegrityError:
+        raise DuplicateSubmission(idempotency_key)
+    if amount:
+        updated = conn.execute('UPDATE users SET credits = credits - ? WHERE id = ? AND credits >= ?',
+                               (amount, user_id, amount)).rowcount
+        if not updated:
+            raise InsufficientCredits(user_id)
+    return reservation_id
+
+
+def attach_story(conn, reservation_id, story_id):
+    conn.execute('UPDATE credit_reservations SET story_id = ? WHERE id = ?', (story_id, reservation_id))
+
+
+def commit(story_id):
+    """Génération réussie : la réservation devient définitive"""
+    db.execute('''UPDATE credit_reservations SET status = 'committed', settled_at = CURRENT_TIMESTAMP
+                  WHERE story_id = ? AND status = 'reserved' ''', (story_id,))
+
+
+def refund(story_id):
+    """Génération ratée : le crédit réservé est rendu (une seule fois)"""
+    with db.transaction(immediate=True) as conn:
+        row = conn.execute('''SELECT id, user_id, amount FROM credit_reservations
+                              WHERE story_id = ? AND status = 'reserved' ''', (story_id,)).fetchone()
+        if not row:
+            return False
+        reservation_id, user_id, amount = row
+        conn.execute('''UPDATE credit_reservations SET status = 'refunded', settled_at = CURRENT_TIMESTAMP
+                        WHERE id = ?''', (reservation_id,))
+        if amount:
+            conn.execute('UPDATE users SET credits = credits + ? WHERE id = ?', (amount, user_id))
+    return True
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Accès à la base SQLite pour Histoires Magiques
+Pool de connexions par processus, mode WAL et pragmas réglés une fois
+par connexion, requêtes préparées réutilisées via le cache de sqlite3.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DATABASE = os.environ.get('DATABASE_PATH', 'histoires_magiques.db')
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+BUSY_TIMEOUT_MS = int(os.environ.get('DB_BUSY_TIMEOUT_MS', 5000))
+# Nombre de requêtes préparées gardées en cache par connexion
+STATEMENT_CACHE_SIZE = 256
+
+PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA mmap_size = 134217728',
+    'PRAGMA temp_store = MEMORY',
+    f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}',
+)
+
+
+def _connect(path):
+    # isolation_level=None : autocommit, les transactions sont ouvertes explicitement
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Pool borné de connexions partagées entre les threads d'un même processus"""
+
+    def __init__(self, path, size):
+        self.path = path
+        self.pid = os.getpid()
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._slots = threading.BoundedSemaphore(size)
+
+    def acquire(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                return _connect(self.path)
+            except Exception:
+                self._slots.release()
+                raise
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+        self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Un pool par processus : recréé après un fork (workers gunicorn, worker.py)"""
+    global _pool
+    pid = os.getpid()
+    if _pool is None or _pool.pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool.pid != pid:
+                _pool = ConnectionPool(DATABASE, POOL_SIZE)
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction(immediate=False):
+    """Transaction validée en sortie de bloc, annulée en cas d'exception.
+    immediate=True prend le verrou d'écriture dès le début (lecture puis écriture)."""
+    with get_connection() as conn:
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+def query_one(sql, params=(), row_factory=None):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = row_factory
+        return cursor.execute(sql, params).fetchone()
+
+
+def query_all(sql, params=(), row_factory=None):
+    with get_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = row_factory
+        return cursor.execute(sql, params).fetchall()
+
+
+def execute(sql, params=()):
+    """Exécute une écriture isolée, retourne le curseur (lastrowid, rowcount)"""
+    with get_connection() as conn:
+        return conn.execute(sql, params)
+
+
+def dict_factory(cursor, row):
+    return {column[0]: row[i] for i, column in enumerate(cursor.description)}
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Cache disque borné en taille pour Histoires Magiques
+Un fichier par entrée, nommé par le hash de la clé, partagé par tous les
+processus (écritures atomiques). Chaque lecture rafraîchit la date de
+modification du fichier ; au-delà de max_bytes, les fichiers les moins
+récemment utilisés sont supprimés.
+Avec metrics_prefix, les compteurs (hits, misses, writes, evictions) sont
+ceux de tous les processus (voir metrics.py), sinon ceux du processus courant.
+"""
+
+import hashlib
+import os
+import threading
+import time
+
+import metrics
+
+STAT_NAMES = ('hits', 'misses', 'writes', 'evictions')
+
+class DiskLRUCache:
+
+    def __init__(self, directory, max_bytes, ext='', metrics_prefix=None):
+        self.directory = os.path.abspath(directory)
+        self.max_bytes = max_bytes
+        self.ext = ext
+        self.metrics_prefix = metrics_prefix
+        self._lock = threading.Lock()
+        self._size = None
+        self._stats = dict.fromkeys(STAT_NAMES, 0)
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _count(self, name, value=1):
+        if self.metrics_prefix:
+            metrics.increment(self.metrics_prefix + name, value)
+            return
+        with self._lock:
+            self._stats[name] += value
+
+    def get_stats(self):
+        if self.metrics_prefix:
+            stats = metrics.get_counters(self.metrics_prefix, STAT_NAMES)
+        else:
+            with self._lock:
+                stats = dict(self._stats)
+        with self._lock:
+            return dict(stats, size_bytes=self._size)
+
+    def path_for(self, key):
+        name = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name[:2], name + self.ext)
+
+    def get(self, key, count=True):
+        """Chemin du fichier en cache, ou None.
+        count=False : relecture d'une recherche déjà comptée (ex. après attente d'un autre thread)"""
+        path = self.path_for(key)
+        try:
+            # Date d'utilisation pour l'éviction LRU
+            os.utime(path)
+        except OSError:
+            if count:
+                self._count('misses')
+            return None
+        if count:
+            self._count('hits')
+        return path
+
+    def get_bytes(self, key, count=True):
+        f = self.open_file(key, count)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    def open_file(self, key, count=True):
+        """Fichier de l'entrée ouvert en lecture (à fermer), ou None ; reste lisible
+        même si l'entrée est évincée ensuite"""
+        path = self.get(key, count)
+        if path is None:
+            return None
+        try:
+            return open(path, 'rb')
+        except OSError:
+            # Évincé par un autre processus entre-temps
+            return None
+
+    def put(self, key, data):
+        """Écrit l'entrée (remplace l'existante) et retourne son chemin"""
+        return self.write_file(key, lambda f: f.write(data))
+
+    def write_file(self, key, write):
+        """Écrit l'entrée par write(f), f fichier binaire ouvert : le contenu va directement
+        sur disque, sans passer en entier par la mémoire. Retourne le chemin de l'entrée."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                write(f)
+                size = f.seek(0, os.SEEK_END)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._count('writes')
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            over = self._size is None or self._size > self.max_bytes
+        if over:
+            self.evict()
+        return path
+
+    def _entries(self):
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                # Fichiers temporaires abandonnés (processus tué pendant l'écriture)
+                if name.endswith('.tmp') and stat.st_mtime < time.time() - 3600:
+                    entries.append((0, stat.st_size, path))
+                elif not name.endswith('.tmp'):
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Supprime les entrées les plus anciennes jusqu'à repasser sous max_bytes"""
+        entries = sorted(self._entries())
+        size = sum(entry[1] for entry in entries)
+        evicted = 0
+        for _, entry_size, path in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+            evicted += 1
+        with self._lock:
+            self._size = size
+        if evicted:
+            self._count('evictions', evicted)
+        return evicted
+
+    def clear(self):
+        for _, _, path in self._entries():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        with self._lock:
+            self._size = 0
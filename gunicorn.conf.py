@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Configuration gunicorn pour Histoires Magiques
+Démarre le processus worker.py à côté des workers web (même disque, même base SQLite).
+Le maître gunicorn récupère tous ses enfants (waitpid(-1)) sans savoir relancer
+celui-ci : un thread de surveillance le redémarre s'il s'arrête.
+Workers web à threads (gthread) : une lecture en flux de /story/<id>/stream
+n'occupe qu'un thread, pas tout le processus.
+"""
+
+import os
+import subprocess
+import sys
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# Au-delà du pire appel en flux : délai OpenAI à chaque essai plus les attentes entre essais (8 s au plus)
+_openai_timeout = float(os.environ.get('OPENAI_TIMEOUT', 30))
+_openai_retries = int(os.environ.get('OPENAI_MAX_RETRIES', 3))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT',
+                             _openai_timeout * (_openai_retries + 1) + 8 * _openai_retries + 30))
+
+JOB_WORKER_CHECK_INTERVAL = float(os.environ.get('JOB_WORKER_CHECK_INTERVAL', 5))
+# Attente maximale entre deux redémarrages quand le worker plante en boucle
+JOB_WORKER_MAX_BACKOFF = 60
+
+_job_worker = None
+_stopping = threading.Event()
+
+
+def _start_job_worker(server):
+    global _job_worker
+    # Interpréteur séparé (pas un fork du maître) : les workers web n'en héritent rien
+    _job_worker = subprocess.Popen([sys.executable, os.path.join(BASE_DIR, 'worker.py')])
+    server.log.info('Worker de génération démarré (pid %s)', _job_worker.pid)
+
+
+def _watch_job_worker(server):
+    backoff = 1
+    while not _stopping.wait(JOB_WORKER_CHECK_INTERVAL):
+        # poll() voit aussi un enfant déjà récupéré par le waitpid(-1) du maître (ECHILD)
+        if _job_worker.poll() is None:
+            backoff = 1
+            continue
+        server.log.error('Worker de génération arrêté (pid %s, code %s), redémarrage dans %ss',
+                         _job_worker.pid, _job_worker.returncode, backoff)
+        if _stopping.wait(backoff):
+            return
+        _start_job_worker(server)
+        backoff = min(backoff * 2, JOB_WORKER_MAX_BACKOFF)
+
+
+def on_starting(server):
+    if os.environ.get('START_JOB_WORKER', '1') != '1':
+        return
+    _start_job_worker(server)
+    threading.Thread(target=_watch_job_worker, args=(server,), name='job-worker-watchdog', daemon=True).start()
+
+
+def on_exit(server):
+    _stopping.set()
+    if _job_worker and _job_worker.poll() is None:
+        _job_worker.terminate()
+        try:
+            _job_worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            _job_worker.kill()
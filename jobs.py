@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+File de travaux de génération d'histoires pour Histoires Magiques
+La table jobs de histoires_magiques.db sert de file locale durable :
+les routes Flask y déposent les demandes, le processus worker.py les traite.
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import admission
+import db
+
+MAX_ATTEMPTS = 3
+
+# Délai laissé à la page de résultat pour écrire le texte en direct (SSE)
+# avant que worker.py ne s'en charge
+STREAM_CLAIM_GRACE = int(os.environ.get('STREAM_CLAIM_GRACE', 10))
+# Bail du flux SSE : sans signe de vie (started_at) depuis STREAM_LEASE secondes,
+# le flux est considéré perdu (processus web tué) et le texte rendu au worker
+STREAM_LEASE = int(os.environ.get('STREAM_LEASE', 120))
+
+# Étapes suivies pour chaque histoire
+# Le PDF n'est plus une étape : il est rendu au premier téléchargement (pdf_status = 'on_demand')
+STAGES = ('text', 'audio')
+
+
+def _now(delay=0):
+    return (datetime.utcnow() + timedelta(seconds=delay)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def enqueue_job(conn, user_id, story_id, params, delay=0, text_done=False):
+    """Ajoute un travail dans la file (dans la transaction de la connexion fournie).
+    text_done : le texte est déjà écrit, seul l'audio reste à produire."""
+    return conn.execute('''INSERT INTO jobs (user_id, story_id, params, available_at, text_status, pdf_status)
+                           VALUES (?, ?, ?, ?, ?, 'on_demand')''',
+                        (user_id, story_id, json.dumps(params), _now(delay),
+                         'done' if text_done else 'pending')).lastrowid
+
+
+def claim_next_job():
+    """Réserve atomiquement le prochain travail disponible, ou None"""
+    with db.transaction(immediate=True) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = db.dict_factory
+        # Plafond d'appels IA atteint : seuls les travaux dont le texte est écrit (PDF, audio) avancent
+        text_filter = '' if admission.llm_slot_available(conn) else "AND text_status = 'done'"
+        job = cursor.execute(f'''SELECT * FROM jobs
+                                 WHERE status = 'queued' AND available_at <= ? {text_filter}
+                                 ORDER BY id LIMIT 1''', (_now(),)).fetchone()
+        if job:
+            conn.execute('''UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?
+                            WHERE id = ?''', (_now(), job['id']))
+        return job
+
+
+def claim_text_stream(story_id):
+    """Réserve l'écriture du texte pour le flux SSE si le worker ne l'a pas encore prise"""
+    with db.transaction(immediate=True) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = db.dict_factory
+        job = cursor.execute('SELECT * FROM jobs WHERE story_id = ? ORDER BY id DESC LIMIT 1',
+                             (story_id,)).fetchone()
+        if not job or job['status'] != 'queued' or job['text_status'] != 'pending':
+            return None
+        # Trop d'appels IA en cours : la page attend son tour en interrogeant le statut
+        if not admission.llm_slot_available(conn):
+            return None
+        conn.execute('''UPDATE jobs SET status = 'streaming', text_status = 'streaming', started_at = ?
+                        WHERE id = ?''', (_now(), job['id']))
+        return job
+
+
+def renew_text_stream(job_id):
+    """Prolonge le bail du flux ; False s'il a expiré entre-temps (texte repris par le worker)"""
+    return db.execute("UPDATE jobs SET started_at = ? WHERE id = ? AND status = 'streaming'",
+                      (_now(), job_id)).rowcount == 1
+
+
+def release_text_stream(job_id, text_done):
+    """Rend le travail au worker : l'audio si le texte est écrit, sinon tout.
+    Sans effet si le bail a expiré (travail déjà remis en file) ; retourne True si rendu."""
+    return db.execute('''UPDATE jobs SET status = 'queued', text_status = ?, available_at = ?
+                         WHERE status = 'streaming' AND id = ?''',
+                      ('done' if text_done else 'pending', _now(), job_id)).rowcount == 1
+
+
+def update_stage(job_id, stage, status):
+    if stage not in STAGES:
+        raise ValueError(f'Étape inconnue : {stage}')
+    db.execute(f'UPDATE jobs SET {stage}_status = ? WHERE id = ?', (status, job_id))
+
+
+def set_audio_preview(job_id, key):
+    """Clé du premier morceau audio (cache des aperçus), servi jusqu'à la fin du travail"""
+    db.execute('UPDATE jobs SET audio_preview = ? WHERE id = ?', (key, job_id))
+
+
+def record_timings(job_id, timings):
+    """Durées par étape (secondes), pour mesurer le gain de la parallélisation"""
+    db.execute('UPDATE jobs SET timings = ? WHERE id = ?', (json.dumps(timings), job_id))
+
+
+def finish_job(job_id):
+    # L'aperçu audio ne sert plus une fois le travail terminé
+    db.execute('''UPDATE jobs SET status = 'done', error = NULL, audio_preview = NULL, finished_at = ?
+                  WHERE id = ?''', (_now(), job_id))
+
+
+def fail_job(job_id, attempts, error):
+    """Replanifie le travail avec un délai croissant, ou l'abandonne après MAX_ATTEMPTS (retourne True)"""
+    if attempts < MAX_ATTEMPTS:
+        db.execute("UPDATE jobs SET status = 'queued', error = ?, available_at = ? WHERE id = ?",
+                   (error, _now(5 * 2 ** attempts), job_id))
+        return False
+    db.execute('''UPDATE jobs SET status = 'failed', error = ?, audio_preview = NULL, finished_at = ?
+                  WHERE id = ?''', (error, _now(), job_id))
+    return True
+
+
+def requeue_stale_jobs(max_age_minutes=10):
+    """Remet en file les travaux restés en cours après l'arrêt brutal d'un worker ou d'un flux"""
+    limit = _now(-60 * max_age_minutes)
+    return db.execute('''UPDATE jobs SET status = 'queued',
+                              text_status = CASE text_status WHEN 'streaming' THEN 'pending' ELSE text_status END
+                           WHERE status IN ('running', 'streaming') AND started_at < ?''',
+                      (limit,)).rowcount
+
+
+def requeue_stale_streams():
+    """Remet en file les flux SSE dont le bail a expiré (appelé régulièrement par worker.py) :
+    sinon ils occupent pour toujours une place du plafond LLM_MAX_IN_FLIGHT"""
+    return db.execute('''UPDATE jobs SET status = 'queued', text_status = 'pending', available_at = ?
+                         WHERE status = 'streaming' AND started_at < ?''',
+                      (_now(), _now(-STREAM_LEASE))).rowcount
+
+
+def get_job_for_story(story_id):
+    return db.query_one('SELECT * FROM jobs WHERE story_id = ? ORDER BY id DESC LIMIT 1',
+                        (story_id,), row_factory=db.dict_factory)
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Client OpenAI partagé pour Histoires Magiques
+Un seul client par processus (pool de connexions HTTP gardé chaud),
+reprises avec attente exponentielle sur 429/5xx et compteurs d'usage
+(partagés entre processus, voir metrics.py).
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+import openai
+
+import metrics
+
+logger = logging.getLogger('histoires.llm')
+
+OPENAI_MODEL = os.environ.get('OPENAI_MODEL', 'gpt-3.5-turbo')
+OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 30))
+OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 3))
+MAX_TOKENS = 800
+TEMPERATURE = 0.8
+
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+STAT_NAMES = ('requests', 'successes', 'retries', 'errors', 'fallbacks')
+
+
+class EmptyCompletion(Exception):
+    """Réponse sans texte (filtre de contenu, réponse tronquée à vide)"""
+    pass
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def increment(name, amount=1):
+    metrics.increment(f'llm.{name}', amount)
+
+
+def get_stats():
+    """Compteurs de tous les processus (web, flux SSE et worker.py)"""
+    return metrics.get_counters('llm.', STAT_NAMES)
+
+
+def record_fallback(error):
+    """À appeler quand une histoire de secours est servie à la place du texte IA"""
+    increment('fallbacks')
+    logger.warning('Histoire de secours servie : %s', error)
+
+
+def get_client():
+    """Client OpenAI du processus courant (recréé après un fork)"""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _client_lock:
+            if _client is None or _client_pid != pid:
+                # Les reprises sont gérées ici pour être comptées
+                _client = openai.OpenAI(api_key=os.environ.get('OPENAI_API_KEY'),
+                                        timeout=OPENAI_TIMEOUT, max_retries=0)
+                _client_pid = pid
+    return _client
+
+
+def _is_retryable(error):
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def _retry_delay(error, attempt):
+    response = getattr(error, 'response', None)
+    retry_after = response.headers.get('retry-after') if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt) * (0.5 + random.random() / 2)
+
+
+def _with_retries(call):
+    attempt = 0
+    while True:
+        increment('requests')
+        try:
+            return call()
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= OPENAI_MAX_RETRIES:
+                increment('errors')
+                raise
+            increment('retries')
+            delay = _retry_delay(e, attempt)
+            logger.info('Appel OpenAI en échec (%s), nouvel essai dans %.1fs', e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+def complete(prompt, model=None, temperature=TEMPERATURE, max_tokens=MAX_TOKENS):
+    """Retourne le texte complet de la réponse"""
+    response = _with_retries(lambda: get_client().chat.completions.create(
+        model=model or OPENAI_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature
+    ))
+    content = response.choices[0].message.content
+    if not content or not content.strip():
+        # Traitée comme un échec : l'appelant sert un squelette ou le texte de secours
+        increment('errors')
+        raise EmptyCompletion(f'Réponse vide ({response.choices[0].finish_reason})')
+    increment('successes')
+    return content
+
+
+def stream(prompt, model=None, temperature=TEMPERATURE, max_tokens=MAX_TOKENS):
+    """Renvoie les morceaux de texte au fil de l'eau ; seule l'ouverture du flux est rejouée"""
+    response = _with_retries(lambda: get_client().chat.completions.create(
+        model=model or OPENAI_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True
+    ))
+    has_text, finish_reason = False, None
+    try:
+        for chunk in response:
+            if not chunk.choices:
+                continue
+            finish_reason = chunk.choices[0].finish_reason or finish_reason
+            if chunk.choices[0].delta.content:
+                has_text = has_text or bool(chunk.choices[0].delta.content.strip())
+                yield chunk.choices[0].delta.content
+    except Exception:
+        increment('errors')
+        raise
+    if not has_text:
+        # Même traitement que complete() : rien n'est enregistré, le worker reprend le texte
+        increment('errors')
+        raise EmptyCompletion(f'Flux vide ({finish_reason})')
+    increment('successes')
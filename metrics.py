@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Compteurs partagés pour Histoires Magiques
+Les workers gunicorn et worker.py sont des processus distincts : les compteurs
+lus par /metrics (appels IA, cache des synthèses) vivent dans la table SQLite
+metrics_counters, comme les seaux d'admission (rate_buckets), et non en mémoire.
+Une écriture par événement : quelques-unes par histoire générée.
+"""
+
+import logging
+import sqlite3
+
+import db
+
+logger = logging.getLogger('histoires.metrics')
+
+
+def increment(name, amount=1):
+    """Ajoute amount au compteur name ; un échec d'écriture ne gêne jamais l'appelant"""
+    try:
+        db.execute('''INSERT INTO metrics_counters (name, value) VALUES (?, ?)
+                      ON CONFLICT (name) DO UPDATE SET value = value + excluded.value''', (name, amount))
+    except sqlite3.Error as e:
+        logger.warning('Compteur %s non enregistré : %s', name, e)
+
+
+def get_counters(prefix, names=()):
+    """Compteurs dont le nom commence par prefix (préfixe retiré) ; names : compteurs valant 0 par défaut"""
+    counters = dict.fromkeys(names, 0)
+    rows = db.query_all('SELECT name, value FROM metrics_counters WHERE substr(name, 1, ?) = ?',
+                        (len(prefix), prefix))
+    for name, value in rows:
+        counters[name[len(prefix):]] = value
+    return counters
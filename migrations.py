@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Migrations du schéma SQLite pour Histoires Magiques
+Chaque migration est une fonction numérotée par sa position dans MIGRATIONS ;
+la version appliquée est stockée dans PRAGMA user_version. Au démarrage,
+les workers gunicorn et le worker de génération appellent migrate() :
+un verrou de fichier garantit qu'un seul processus applique les migrations.
+
+Les migrations sont idempotentes (IF NOT EXISTS, colonnes vérifiées) :
+une base créée avant ce système, en version 0, est mise à niveau sans perte.
+Ne jamais modifier une migration publiée : en ajouter une nouvelle à la fin.
+
+Usage : python migrations.py
+"""
+
+import logging
+import os
+
+import db
+
+try:
+    import fcntl
+except ImportError:
+    # Windows (développement local) : un seul processus, pas de verrou
+    fcntl = None
+
+logger = logging.getLogger('histoires.migrations')
+
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+
+def initial_schema(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        email TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        name TEXT NOT NULL,
+        plan TEXT DEFAULT 'free',
+        credits INTEGER DEFAULT 3,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS stories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        child_name TEXT,
+        theme TEXT,
+        character_type TEXT,
+        moral TEXT,
+        age_range TEXT,
+        audio_file TEXT,
+        pdf_file TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS subscriptions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        plan TEXT NOT NULL,
+        paypal_subscription_id TEXT,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )''')
+
+
+def job_queue(conn):
+    # File des travaux de génération (voir jobs.py et worker.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        story_id INTEGER,
+        status TEXT DEFAULT 'queued',
+        params TEXT NOT NULL,
+        text_status TEXT DEFAULT 'pending',
+        pdf_status TEXT DEFAULT 'pending',
+        audio_status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        error TEXT,
+        available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        timings TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (story_id) REFERENCES stories (id)
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at)')
+    if 'timings' not in _columns(conn, 'jobs'):
+        conn.execute('ALTER TABLE jobs ADD COLUMN timings TEXT')
+
+
+def story_cache_table(conn):
+    # Cache des textes générés (voir story_cache.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS story_cache (
+        key TEXT PRIMARY KEY,
+        content TEXT NOT NULL,
+        model TEXT,
+        created_at REAL NOT NULL,
+        last_used REAL NOT NULL,
+        hits INTEGER DEFAULT 0
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_story_cache_last_used ON story_cache (last_used)')
+
+
+def story_skeletons_table(conn):
+    # Squelettes d'histoires pré-générés (voir skeletons.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS story_skeletons (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        theme TEXT NOT NULL,
+        character_type TEXT NOT NULL,
+        age_range TEXT NOT NULL,
+        content TEXT NOT NULL,
+        model TEXT,
+        used_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_story_skeletons_combo
+                    ON story_skeletons (theme, character_type, age_range, used_count)''')
+
+
+def story_library_index(conn):
+    # Bibliothèque paginée et compteur d'histoires (voir story_library.py)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_stories_user_created ON stories (user_id, created_at)')
+    if 'story_count' not in _columns(conn, 'users'):
+        conn.execute('ALTER TABLE users ADD COLUMN story_count INTEGER NOT NULL DEFAULT 0')
+        conn.execute('''UPDATE users SET story_count =
+                            (SELECT COUNT(*) FROM stories WHERE stories.user_id = users.id)''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_stories_count_insert AFTER INSERT ON stories
+                    BEGIN
+                        UPDATE users SET story_count = story_count + 1 WHERE id = NEW.user_id;
+                    END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_stories_count_delete AFTER DELETE ON stories
+                    BEGIN
+                        UPDATE users SET story_count = story_count - 1 WHERE id = OLD.user_id;
+                    END''')
+
+
+def subscriptions_index(conn):
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_subscriptions_user_status ON subscriptions (user_id, status)')
+
+
+def sessions_table(conn):
+    # Sessions côté serveur (voir sessions.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        data TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions (expires_at)')
+
+
+def credit_reservations_table(conn):
+    # Crédits réservés avant génération, clé d'idempotence du formulaire (voir credits.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS credit_reservations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        story_id INTEGER,
+        idempotency_key TEXT,
+        amount INTEGER NOT NULL DEFAULT 1,
+        status TEXT NOT NULL DEFAULT 'reserved',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        settled_at TIMESTAMP,
+        UNIQUE (user_id, idempotency_key),
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (story_id) REFERENCES stories (id)
+    )''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_credit_reservations_story ON credit_reservations (story_id)')
+
+
+def rate_buckets_table(conn):
+    # Seaux à jetons du contrôle d'admission (voir admission.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS rate_buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )''')
+
+
+def audio_preview_column(conn):
+    # Premier morceau de l'audio, écoutable avant la fin de la synthèse (voir audio_pipeline.py)
+    if 'audio_preview' not in _columns(conn, 'jobs'):
+        conn.execute('ALTER TABLE jobs ADD COLUMN audio_preview TEXT')
+
+
+def user_voice_column(conn):
+    # Voix de narration préférée (voir voices.py) ; NULL = voix par défaut
+    if 'voice_id' not in _columns(conn, 'users'):
+        conn.execute('ALTER TABLE users ADD COLUMN voice_id TEXT')
+
+
+def metrics_counters_table(conn):
+    # Compteurs partagés par tous les processus, lus par /metrics (voir metrics.py)
+    conn.execute('''CREATE TABLE IF NOT EXISTS metrics_counters (
+        name TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    )''')
+
+
+# Ordre = numéro de version (la première migration est la version 1)
+MIGRATIONS = [
+    initial_schema,
+    job_queue,
+    story_cache_table,
+    story_skeletons_table,
+    story_library_index,
+    subscriptions_index,
+    sessions_table,
+    credit_reservations_table,
+    rate_buckets_table,
+    audio_preview_column,
+    user_voice_column,
+    metrics_counters_table,
+]
+
+
+def current_version():
+    return db.query_one('PRAGMA user_version')[0]
+
+
+def _lock(path):
+    lock_file = open(path, 'a')
+    if fcntl:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    return lock_file
+
+
+def migrate():
+    """Applique les migrations en attente ; retourne la liste des versions appliquées"""
+    directory = os.path.dirname(os.path.abspath(db.DATABASE))
+    os.makedirs(directory, exist_ok=True)
+    lock_file = _lock(os.path.abspath(db.DATABASE) + '.migrate.lock')
+    applied = []
+    try:
+        # Relue sous le verrou : un autre processus a peut-être déjà migré
+        version = current_version()
+        for number, migration in enumerate(MIGRATIONS, start=1):
+            if number <= version:
+                continue
+            # La migration et le nouveau numéro de version sont validés ensemble
+            with db.transaction(immediate=True) as conn:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {number}')
+            logger.info('Migration %s appliquée (%s)', number, migration.__name__)
+            applied.append(number)
+    finally:
+        lock_file.close()
+    return applied
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    done = migrate()
+    print(f'{len(done)} migration(s) appliquée(s), schéma en version {len(MIGRATIONS)}')
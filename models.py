@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Enregistrements et requêtes par cas d'usage pour Histoires Magiques
+User, Story et Subscription sont des classes à __slots__ remplies directement
+par la row factory sqlite3 (sans dictionnaire intermédiaire). Chaque requête
+ne lit que les colonnes de sa projection : les listes ne chargent jamais le
+texte complet des histoires. Une colonne hors projection vaut None.
+"""
+
+import db
+
+
+class Record:
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        # Appelé seulement pour un attribut non rempli : colonne absente de la projection
+        if name in self.__slots__:
+            return None
+        raise AttributeError(name)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.as_dict()!r})'
+
+    def as_dict(self):
+        """Colonnes lues par la requête (pour jsonify)"""
+        values = {}
+        for name in self.__slots__:
+            try:
+                values[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                pass
+        return values
+
+    @classmethod
+    def row_factory(cls, cursor, row):
+        record = object.__new__(cls)
+        for column, value in zip(cursor.description, row):
+            setattr(record, column[0], value)
+        return record
+
+
+class User(Record):
+    __slots__ = ('id', 'email', 'password', 'name', 'plan', 'credits', 'story_count', 'voice_id',
+                 'created_at')
+
+
+class Story(Record):
+    __slots__ = ('id', 'user_id', 'title', 'content', 'child_name', 'theme', 'character_type', 'moral',
+                 'age_range', 'audio_file', 'pdf_file', 'created_at')
+
+
+class Subscription(Record):
+    __slots__ = ('id', 'user_id', 'plan', 'paypal_subscription_id', 'status', 'created_at')
+
+
+# Projections par cas d'usage
+USER_LOGIN = 'id, email, password, name'
+USER_ACCOUNT = 'id, name, plan, credits, story_count'
+USER_CREDITS = 'id, plan, credits, voice_id'
+STORY_LIST = 'id, title, child_name, theme, age_range, created_at'
+STORY_DETAIL = 'id, title, content, child_name, audio_file'
+STORY_STATUS = 'id, content, audio_file'
+STORY_PDF = 'id, title, content, child_name'
+SUBSCRIPTION_DETAIL = 'id, plan, status, created_at'
+
+
+def get_user_by_email(email, columns=USER_LOGIN):
+    return db.query_one(f'SELECT {columns} FROM users WHERE email = ?', (email,), row_factory=User.row_factory)
+
+
+def get_user(user_id, columns=USER_ACCOUNT):
+    return db.query_one(f'SELECT {columns} FROM users WHERE id = ?', (user_id,), row_factory=User.row_factory)
+
+
+def get_story(story_id, user_id, columns=STORY_DETAIL):
+    """Histoire de l'utilisateur (None si elle n'existe pas ou appartient à un autre compte)"""
+    return db.query_one(f'SELECT {columns} FROM stories WHERE id = ? AND user_id = ?',
+                        (story_id, user_id), row_factory=Story.row_factory)
+
+
+def get_active_subscription(user_id, columns=SUBSCRIPTION_DETAIL):
+    return db.query_one(f'''SELECT {columns} FROM subscriptions
+                            WHERE user_id = ? AND status = 'active'
+                            ORDER BY created_at DESC LIMIT 1''',
+                        (user_id,), row_factory=Subscription.row_factory)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Orchestration des étapes de génération pour Histoires Magiques
+Une fois le texte écrit, les étapes restantes (audio) sont produites en
+parallèle sur un pool de threads borné, chacune avec son propre délai maximum.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+STAGE_POOL_SIZE = int(os.environ.get('STAGE_POOL_SIZE', 8))
+
+# Délais maximum par étape (secondes)
+STAGE_TIMEOUTS = {
+    'audio': float(os.environ.get('AUDIO_STAGE_TIMEOUT', 90)),
+}
+DEFAULT_TIMEOUT = 60
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=STAGE_POOL_SIZE, thread_name_prefix='stage')
+    return _executor
+
+
+def _timed(func):
+    started = time.monotonic()
+    value = func()
+    return value, time.monotonic() - started
+
+
+def run_stages(stages, timeouts=None):
+    """Lance les étapes en parallèle et attend chacune jusqu'à son délai.
+
+    stages : {nom: fonction sans argument}
+    Retourne {nom: {'status': 'done'|'failed'|'timeout', 'value', 'error', 'duration'}} ;
+    un échec ou un dépassement de délai n'interrompt pas les autres étapes.
+    """
+    timeouts = timeouts or STAGE_TIMEOUTS
+    executor = get_executor()
+    started = time.monotonic()
+    futures = {name: executor.submit(_timed, func) for name, func in stages.items()}
+
+    results = {}
+    for name, future in futures.items():
+        deadline = started + timeouts.get(name, DEFAULT_TIMEOUT)
+        try:
+            value, duration = future.result(timeout=max(0, deadline - time.monotonic()))
+            results[name] = {'status': 'done', 'value': value, 'error': None, 'duration': duration}
+        except TimeoutError:
+            # Le thread ne peut pas être interrompu : son résultat tardif sera ignoré
+            future.cancel()
+            results[name] = {'status': 'timeout', 'value': None, 'error': 'timeout',
+                             'duration': time.monotonic() - started}
+        except Exception as e:
+            results[name] = {'status': 'failed', 'value': None, 'error': str(e),
+                             'duration': time.monotonic() - started}
+    return results
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des pages rendues pour Histoires Magiques
+Une page est mise en cache par variante (connecté ou non, langue) :
+d'abord en mémoire du processus, puis dans un dossier partagé par tous
+les workers gunicorn. La version du déploiement fait partie de la clé,
+un nouveau déploiement invalide donc toutes les entrées.
+"""
+
+import functools
+import hashlib
+import os
+import threading
+import time
+
+from flask import make_response, request, session
+
+import compression
+from translations import get_current_language
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PAGE_CACHE_DIR = os.environ.get('PAGE_CACHE_DIR', '.page_cache')
+PAGE_CACHE_TTL = int(os.environ.get('PAGE_CACHE_TTL', 3600))
+
+_memory = {}
+_memory_lock = threading.Lock()
+_stats = {'memory_hits': 0, 'file_hits': 0, 'misses': 0, 'not_modified': 0, 'compressions': 0}
+
+
+def _deploy_version():
+    """Identifiant du déploiement : commit Render, sinon empreinte des sources des pages"""
+    commit = os.environ.get('RENDER_GIT_COMMIT')
+    if commit:
+        return commit[:12]
+    digest = hashlib.sha256()
+    paths = [os.path.join(BASE_DIR, 'app_final_complet.py'),
+             os.path.join(BASE_DIR, 'static', 'dist', 'manifest.json')]
+    templates_dir = os.path.join(BASE_DIR, 'templates')
+    if os.path.isdir(templates_dir):
+        paths += sorted(os.path.join(templates_dir, name) for name in os.listdir(templates_dir))
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f'{path}:{stat.st_mtime_ns}:{stat.st_size}'.encode())
+    return digest.hexdigest()[:12]
+
+
+DEPLOY_VERSION = _deploy_version()
+
+
+def get_stats():
+    with _memory_lock:
+        return dict(_stats)
+
+
+def _count(name):
+    with _memory_lock:
+        _stats[name] += 1
+
+
+def _file_path(key):
+    return os.path.join(PAGE_CACHE_DIR, f'{key}.html')
+
+
+def _lookup(key):
+    now = time.time()
+    with _memory_lock:
+        entry = _memory.get(key)
+    if entry and entry['expires_at'] > now:
+        _count('memory_hits')
+        return entry
+
+    path = _file_path(key)
+    try:
+        if os.path.getmtime(path) + PAGE_CACHE_TTL > now:
+            with open(path, 'rb') as f:
+                entry = _make_entry(f.read(), os.path.getmtime(path) + PAGE_CACHE_TTL)
+            with _memory_lock:
+                _memory[key] = entry
+            _count('file_hits')
+            return entry
+    except OSError:
+        pass
+    _count('misses')
+    return None
+
+
+def _make_entry(body, expires_at):
+    return {'body': body, 'etag': hashlib.sha256(body).hexdigest()[:20], 'expires_at': expires_at,
+            'encoded': {}}
+
+
+def _write_file(path, data):
+    # Écriture atomique : les autres workers ne lisent jamais un fichier partiel
+    os.makedirs(PAGE_CACHE_DIR, exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _store(key, body):
+    entry = _make_entry(body, time.time() + PAGE_CACHE_TTL)
+    with _memory_lock:
+        _memory[key] = entry
+    _write_file(_file_path(key), body)
+    return entry
+
+
+def _encoded(key, entry, encoding):
+    """Corps pré-compressé de la variante : compressé une seule fois pour tous les workers"""
+    data = entry['encoded'].get(encoding)
+    if data is not None:
+        return data
+    path = f'{_file_path(key)}.{encoding}'
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(_file_path(key)):
+            with open(path, 'rb') as f:
+                data = f.read()
+    except OSError:
+        pass
+    if data is None:
+        data = compression.compress(entry['body'], encoding)
+        _write_file(path, data)
+        _count('compressions')
+    entry['encoded'][encoding] = data
+    return data
+
+
+def purge_old_versions():
+    """Supprime les pages des déploiements précédents"""
+    if not os.path.isdir(PAGE_CACHE_DIR):
+        return
+    for name in os.listdir(PAGE_CACHE_DIR):
+        if not name.startswith(DEPLOY_VERSION + '-'):
+            try:
+                os.remove(os.path.join(PAGE_CACHE_DIR, name))
+            except OSError:
+                pass
+
+
+def clear():
+    with _memory_lock:
+        _memory.clear()
+    if os.path.isdir(PAGE_CACHE_DIR):
+        for name in os.listdir(PAGE_CACHE_DIR):
+            os.remove(os.path.join(PAGE_CACHE_DIR, name))
+
+
+def session_variant():
+    """Variante de page : connecté ou non, et langue de l'interface"""
+    return ('auth' if 'user_id' in session else 'anon', get_current_language())
+
+
+def cached_page(view):
+    """Décorateur : sert la page depuis le cache (avec ETag / 304) pour les requêtes GET"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+
+        key = '-'.join((DEPLOY_VERSION, view.__name__) + session_variant())
+        entry = _lookup(key)
+        if entry is None:
+            body = view(*args, **kwargs)
+            if not isinstance(body, str):
+                return body
+            entry = _store(key, body.encode('utf-8'))
+
+        encoding = compression.negotiate(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response = make_response(_encoded(key, entry, encoding))
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(f"{entry['etag']}-{encoding}")
+        else:
+            response = make_response(entry['body'])
+            response.set_etag(entry['etag'])
+        response.mimetype = 'text/html'
+        # La variante dépend du cookie de session : revalidation à chaque visite (304 si inchangée)
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Cookie')
+        response.vary.add('Accept-Encoding')
+        response = response.make_conditional(request)
+        if response.status_code == 304:
+            _count('not_modified')
+        return response
+    return wrapper
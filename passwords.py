@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Hachage des mots de passe pour Histoires Magiques
+scrypt (hashlib, sans dépendance) avec un sel par utilisateur ; les paramètres
+sont enregistrés dans le hash : scrypt$n$r$p$sel$hash (base64).
+Les anciens hash SHA-256 sans sel sont encore acceptés et remplacés au
+prochain login réussi, comme tout hash dont les paramètres ont changé.
+
+Le coût se règle avec PASSWORD_SCRYPT_N : choisir la valeur avec
+    python passwords.py --target-ms 50
+lancé sur la machine de production (un login bloque un worker synchrone).
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import re
+import time
+
+PASSWORD_SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', 2 ** 14))
+PASSWORD_SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', 8))
+PASSWORD_SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', 1))
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # scrypt utilise 128 * n * r octets : marge pour ne pas dépasser maxmem
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=KEY_SIZE)
+
+
+def hash_password(password, n=None, r=None, p=None):
+    n = n or PASSWORD_SCRYPT_N
+    r = r or PASSWORD_SCRYPT_R
+    p = p or PASSWORD_SCRYPT_P
+    salt = os.urandom(SALT_SIZE)
+    key = _scrypt(password, salt, n, r, p)
+    return f'scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(key)}'
+
+
+def verify_password(password, stored):
+    if not stored:
+        return False
+    if _LEGACY_SHA256.match(stored):
+        legacy = hashlib.sha256(password.encode('utf-8')).hexdigest()
+        return hmac.compare_digest(legacy, stored)
+    try:
+        scheme, n, r, p, salt, key = stored.split('$')
+        if scheme != 'scrypt':
+            return False
+        expected = _b64decode(key)
+        candidate = _scrypt(password, _b64decode(salt), int(n), int(r), int(p))
+    except (ValueError, TypeError):
+        return False
+    return hmac.compare_digest(candidate, expected)
+
+
+def needs_rehash(stored):
+    """Vrai pour un ancien hash SHA-256 ou des paramètres différents de la configuration"""
+    if _LEGACY_SHA256.match(stored or ''):
+        return True
+    parts = (stored or '').split('$')
+    if len(parts) != 6 or parts[0] != 'scrypt':
+        return True
+    return parts[1:4] != [str(PASSWORD_SCRYPT_N), str(PASSWORD_SCRYPT_R), str(PASSWORD_SCRYPT_P)]
+
+
+def _time_hash(n, r, p, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        hash_password('calibration', n, r, p)
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2] * 1000
+
+
+def calibrate(target_ms, r=PASSWORD_SCRYPT_R, p=PASSWORD_SCRYPT_P, rounds=5, max_n=2 ** 20):
+    """Plus grand n (puissance de 2) dont le temps médian reste sous target_ms ; retourne [(n, ms)]"""
+    results = []
+    n = 2 ** 10
+    while n <= max_n:
+        elapsed = _time_hash(n, r, p, rounds)
+        results.append((n, elapsed))
+        if elapsed > target_ms:
+            break
+        n *= 2
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Choisit le coût scrypt pour une latence de login cible')
+    parser.add_argument('--target-ms', type=float, default=50)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    results = calibrate(args.target_ms, rounds=args.rounds)
+    for n, elapsed in results:
+        print(f'n=2^{n.bit_length() - 1:<3} r={PASSWORD_SCRYPT_R} p={PASSWORD_SCRYPT_P} : {elapsed:7.1f} ms')
+    within = [n for n, elapsed in results if elapsed <= args.target_ms]
+    if within:
+        print(f'PASSWORD_SCRYPT_N={within[-1]}')
+    else:
+        print(f'Même n=2^10 dépasse {args.target_ms} ms : réduire PASSWORD_SCRYPT_R')
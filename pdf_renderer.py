@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+Rendu PDF des histoires pour Histoires Magiques
+Polices TrueType embarquées (accents, guillemets typographiques, tout
+l'Unicode couvert par la police) et sous-ensemblées par fpdf2 pour garder
+des fichiers légers. Les métriques d'une police sont lues une seule fois
+par processus ; chaque document repart d'une copie de ce prototype.
+Mise en page : page de titre, paragraphes justifiés avec multi_cell,
+saut de page automatique et numéro de page.
+
+Le rendu (calcul pur) tourne dans un pool de processus : il ne garde pas
+le GIL des workers web ni des threads du worker de génération.
+
+Les PDF sont produits à la demande, au premier téléchargement, puis gardés
+dans un cache disque borné (story_pdf) : la clé couvre l'histoire, le hash
+de son contenu et LAYOUT_VERSION, à incrémenter quand la mise en page change.
+"""
+
+import atexit
+import copy
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+from fpdf import FPDF
+
+from disk_cache import DiskLRUCache
+
+logger = logging.getLogger('histoires.pdf')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PDF_FONT_PATH = os.environ.get('PDF_FONT_PATH')
+PDF_FONT_BOLD_PATH = os.environ.get('PDF_FONT_BOLD_PATH')
+# 0 : rendu dans le processus appelant (développement, tests)
+PDF_RENDER_PROCESSES = int(os.environ.get('PDF_RENDER_PROCESSES', 2))
+PDF_RENDER_TIMEOUT = float(os.environ.get('PDF_RENDER_TIMEOUT', 30))
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR', '.pdf_cache')
+PDF_CACHE_MAX_MB = int(os.environ.get('PDF_CACHE_MAX_MB', 200))
+
+# À incrémenter à chaque changement de mise en page : les PDF en cache sont alors refaits
+LAYOUT_VERSION = 1
+
+# Polices essayées dans l'ordre si PDF_FONT_PATH n'est pas défini
+# (DejaVu Sans est livrée dans static/fonts, licence dans LICENSE-DejaVu.txt)
+FONT_CANDIDATES = [
+    (os.path.join(BASE_DIR, 'static', 'fonts', 'DejaVuSans.ttf'),
+     os.path.join(BASE_DIR, 'static', 'fonts', 'DejaVuSans-Bold.ttf')),
+    ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+     '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+    ('/usr/share/fonts/dejavu/DejaVuSans.ttf',
+     '/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf'),
+]
+FONT_FAMILY = 'StoryFont'
+
+TITLE_SIZE = 26
+SUBTITLE_SIZE = 14
+BODY_SIZE = 12
+LINE_HEIGHT = 7
+MARGIN = 20
+
+# Police de base PDF (latin-1) : équivalents ASCII des signes typographiques courants
+_CORE_REPLACEMENTS = {
+    '‘': "'", '’': "'", '“': '"', '”': '"', '–': '-', '—': '-',
+    '…': '...', '\u00a0': ' ', '\u202f': ' ', 'œ': 'oe', 'Œ': 'OE',
+}
+
+_fonts = {}
+_fonts_lock = threading.Lock()
+_fallback_warned = False
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def find_fonts():
+    """(regular, bold) à embarquer, ou (None, None) pour les polices de base"""
+    if PDF_FONT_PATH and os.path.exists(PDF_FONT_PATH):
+        bold = PDF_FONT_BOLD_PATH if PDF_FONT_BOLD_PATH and os.path.exists(PDF_FONT_BOLD_PATH) else None
+        return PDF_FONT_PATH, bold
+    for regular, bold in FONT_CANDIDATES:
+        if os.path.exists(regular):
+            return regular, bold if os.path.exists(bold) else None
+    return None, None
+
+
+def _font_prototype(path, style):
+    """Police analysée une fois par processus : (TTFFont prototype, octets du fichier)"""
+    with _fonts_lock:
+        cached = _fonts.get((path, style))
+        if cached is None:
+            scratch = FPDF()
+            scratch.add_font(FONT_FAMILY, style, path)
+            with open(path, 'rb') as f:
+                data = f.read()
+            cached = (scratch.fonts[f'{FONT_FAMILY.lower()}{style}'], data)
+            _fonts[(path, style)] = cached
+        return cached
+
+
+def _add_font(pdf, path, style=''):
+    from fontTools import ttLib
+    from fpdf.fonts import SubsetMap
+
+    prototype, data = _font_prototype(path, style)
+    font = copy.copy(prototype)
+    # État propre au document : numéro, sous-ensemble de glyphes et table TrueType
+    # (le sous-ensemblage de fpdf2 modifie la table, elle n'est jamais partagée)
+    font.i = len(pdf.fonts) + 1
+    font.ttfont = ttLib.TTFont(io.BytesIO(data), recalcTimestamp=False, fontNumber=0, lazy=True)
+    font.missing_glyphs = []
+    font.subset = SubsetMap(font, [ord(char) for char in '\x00 \r\n0123456789' + pdf.str_alias_nb_pages])
+    pdf.fonts[font.fontkey] = font
+
+
+class StoryPDF(FPDF):
+
+    def footer(self):
+        # Pas de numéro sur la page de titre
+        if self.page_no() > 1:
+            self.set_y(-15)
+            self.set_font(self.body_family, size=9)
+            self.cell(0, 10, str(self.page_no() - 1), align='C')
+
+
+def _setup_fonts(pdf):
+    global _fallback_warned
+    regular, bold = find_fonts()
+    if not regular:
+        if not _fallback_warned:
+            # DejaVu est livrée dans static/fonts : son absence est une erreur de déploiement
+            logger.warning('Aucune police TrueType trouvée : Helvetica, caractères hors latin-1 retirés')
+            _fallback_warned = True
+        pdf.body_family = pdf.title_family = 'Helvetica'
+        pdf.title_style = 'B'
+        return None
+    try:
+        _add_font(pdf, regular)
+        if bold:
+            _add_font(pdf, bold, 'B')
+    except Exception:
+        # Interne fpdf2 différent (autre version) : chargement standard, sans cache
+        pdf.fonts.pop(FONT_FAMILY.lower(), None)
+        pdf.fonts.pop(FONT_FAMILY.lower() + 'B', None)
+        pdf.add_font(FONT_FAMILY, '', regular)
+        if bold:
+            pdf.add_font(FONT_FAMILY, 'B', bold)
+    pdf.body_family = pdf.title_family = FONT_FAMILY
+    pdf.title_style = 'B' if bold else ''
+    return pdf.fonts[FONT_FAMILY.lower()].cmap
+
+
+def clean_text(text, cmap=None):
+    """Texte imprimable par la police : caractères sans glyphe retirés (emoji), ou latin-1 pour les polices de base"""
+    text = unicodedata.normalize('NFC', text or '')
+    if cmap is not None:
+        return ''.join(char for char in text if char in '\n' or ord(char) in cmap)
+    for source, target in _CORE_REPLACEMENTS.items():
+        text = text.replace(source, target)
+    return text.encode('latin-1', 'ignore').decode('latin-1')
+
+
+def paragraphs(content):
+    # Lignes vides = nouveaux paragraphes ; les retours simples sont gardés dans le paragraphe
+    blocks = re.split(r'\n\s*\n', content.replace('\r\n', '\n'))
+    return [block.strip() for block in blocks if block.strip()]
+
+
+def render_story(title, content, child_name):
+    """Rendu dans le processus courant ; retourne les octets du PDF"""
+    pdf = StoryPDF(format='A4')
+    pdf.set_margins(MARGIN, MARGIN, MARGIN)
+    pdf.set_auto_page_break(True, margin=MARGIN)
+    pdf.set_title(title)
+    pdf.set_creator('Histoires Magiques')
+    cmap = _setup_fonts(pdf)
+
+    # Page de titre
+    pdf.add_page()
+    pdf.set_y(pdf.h / 3)
+    pdf.set_font(pdf.title_family, pdf.title_style, TITLE_SIZE)
+    pdf.multi_cell(0, TITLE_SIZE * 0.5, clean_text(title, cmap), align='C')
+    pdf.ln(10)
+    pdf.set_font(pdf.body_family, size=SUBTITLE_SIZE)
+    pdf.multi_cell(0, SUBTITLE_SIZE * 0.5, clean_text(f'Une histoire pour {child_name}', cmap), align='C')
+    pdf.set_y(pdf.h - 3 * MARGIN)
+    pdf.set_font(pdf.body_family, size=10)
+    pdf.cell(0, 10, 'Histoires Magiques', align='C')
+
+    # Histoire : paragraphes justifiés, saut de page automatique
+    pdf.add_page()
+    pdf.set_font(pdf.body_family, size=BODY_SIZE)
+    for paragraph in paragraphs(content):
+        pdf.multi_cell(0, LINE_HEIGHT, clean_text(paragraph, cmap), align='J')
+        pdf.ln(LINE_HEIGHT / 2)
+
+    return bytes(pdf.output())
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn : les processus de rendu ne héritent pas des threads ni des connexions de l'appelant
+            _pool = ProcessPoolExecutor(max_workers=PDF_RENDER_PROCESSES,
+                                        mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def render_pdf(title, content, child_name, timeout=None):
+    """Rendu dans le pool de processus (ou sur place si PDF_RENDER_PROCESSES=0)"""
+    # Un processus démon (worker lancé par gunicorn.conf.py) ne peut pas avoir d'enfants
+    if PDF_RENDER_PROCESSES <= 0 or multiprocessing.current_process().daemon:
+        return render_story(title, content, child_name)
+    return _get_pool().submit(render_story, title, content, child_name).result(timeout=timeout)
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(PDF_CACHE_DIR, PDF_CACHE_MAX_MB * 1024 * 1024, ext='.pdf')
+        return _cache
+
+
+def cache_key(story_id, title, content, child_name):
+    digest = hashlib.sha256('\0'.join((title, child_name or '', content)).encode('utf-8')).hexdigest()
+    return f'{story_id}:{digest}:{LAYOUT_VERSION}'
+
+
+def story_pdf(story_id, title, content, child_name):
+    """PDF de l'histoire : (chemin du fichier, ETag), rendu au premier appel puis servi depuis le cache"""
+    key = cache_key(story_id, title, content, child_name)
+    etag = hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+    cache = get_cache()
+    path = cache.get(key)
+    if path is None:
+        path = cache.put(key, render_pdf(title, content, child_name, timeout=PDF_RENDER_TIMEOUT))
+    return path, etag
+
+
+@atexit.register
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
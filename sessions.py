@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Sessions côté serveur pour Histoires Magiques
+Le cookie ne contient plus qu'un identifiant opaque et aléatoire ; les
+données (utilisateur connecté, langue, messages flash) sont dans la table
+SQLite sessions. Elles ne sont lues qu'au premier accès à la session
+pendant la requête, et réécrites seulement si elles ont changé.
+Un thread par processus supprime les sessions expirées.
+"""
+
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin, session_json_serializer
+
+import db
+
+logger = logging.getLogger('histoires.sessions')
+
+SESSION_LIFETIME = int(os.environ.get('SESSION_LIFETIME', 14 * 24 * 3600))
+SESSION_GC_INTERVAL = int(os.environ.get('SESSION_GC_INTERVAL', 600))
+
+_SID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{43}$')
+
+_gc_thread = None
+_gc_lock = threading.Lock()
+
+
+def _new_sid():
+    return secrets.token_urlsafe(32)
+
+
+class SqliteSession(SessionMixin):
+    """Session chargée depuis SQLite au premier accès seulement"""
+
+    def __init__(self, sid=None):
+        self.sid = sid
+        self.old_sid = None
+        self.stale = False
+        self.accessed = False
+        self.modified = False
+        self.expires_at = None
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = {}
+            if self.sid:
+                row = db.query_one('SELECT data, expires_at FROM sessions WHERE id = ? AND expires_at > ?',
+                                   (self.sid, time.time()))
+                if row:
+                    self._data = session_json_serializer.loads(row[0])
+                    self.expires_at = row[1]
+                else:
+                    # Identifiant inconnu ou expiré : on n'adopte jamais un id fourni par le client
+                    self.sid = None
+                    self.stale = True
+        self.accessed = True
+        return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        if self.data:
+            self._data.clear()
+            self.modified = True
+
+    def regenerate(self):
+        """Nouvel identifiant en gardant les données (à appeler à la connexion)"""
+        self.data
+        if self.sid and not self.old_sid:
+            self.old_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class SqliteSessionInterface(SessionInterface):
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and not _SID_PATTERN.match(sid):
+            sid = None
+        return SqliteSession(sid)
+
+    def save_session(self, app, session, response):
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.loaded:
+            return
+
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        now = time.time()
+
+        if session.old_sid:
+            db.execute('DELETE FROM sessions WHERE id = ?', (session.old_sid,))
+
+        if not session:
+            if session.sid:
+                db.execute('DELETE FROM sessions WHERE id = ?', (session.sid,))
+            if session.sid or session.old_sid or session.stale or session.modified:
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app),
+                                       samesite=self.get_cookie_samesite(app))
+            return
+
+        if session.modified or session.sid is None:
+            session.sid = session.sid or _new_sid()
+            db.execute('INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)',
+                       (session.sid, session_json_serializer.dumps(dict(session)), now + SESSION_LIFETIME))
+        elif session.expires_at and session.expires_at - now < SESSION_LIFETIME / 2:
+            # Session active : on repousse l'expiration sans réécrire les données
+            db.execute('UPDATE sessions SET expires_at = ? WHERE id = ?', (now + SESSION_LIFETIME, session.sid))
+        else:
+            return
+
+        response.set_cookie(name, session.sid,
+                            expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app),
+                            domain=domain, path=path,
+                            secure=self.get_cookie_secure(app),
+                            samesite=self.get_cookie_samesite(app))
+
+
+def collect_expired():
+    return db.execute('DELETE FROM sessions WHERE expires_at <= ?', (time.time(),)).rowcount
+
+
+def _gc_loop():
+    while True:
+        time.sleep(SESSION_GC_INTERVAL)
+        try:
+            removed = collect_expired()
+            if removed:
+                logger.info('%s session(s) expirée(s) supprimée(s)', removed)
+        except Exception as e:
+            logger.warning('Nettoyage des sessions impossible : %s', e)
+
+
+def start_gc():
+    """Démarre le nettoyage périodique (une fois par processus)"""
+    global _gc_thread
+    with _gc_lock:
+        if _gc_thread is None or not _gc_thread.is_alive():
+            _gc_thread = threading.Thread(target=_gc_loop, name='session-gc', daemon=True)
+            _gc_thread.start()
+
+
+def init_app(app):
+    app.session_interface = SqliteSessionInterface()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Squelettes d'histoires pré-générés pour Histoires Magiques
+Pour chaque combinaison (thème, personnage, âge) du formulaire, un petit
+stock d'histoires est écrit à l'avance avec des marqueurs à la place du
+prénom et de la morale : une histoire « instantanée » est prête en quelques
+millisecondes, même quand l'IA est lente ou que le quota est épuisé.
+
+Remplissage en lot : python skeletons.py (aussi lancé en tâche de fond par worker.py)
+"""
+
+import logging
+import os
+import sys
+
+import admission
+import db
+import llm_client
+
+logger = logging.getLogger('histoires.skeletons')
+
+NAME_MARKER = '[PRENOM]'
+MORAL_MARKER = '[MORALE]'
+
+# Valeurs proposées par le formulaire de create_story
+THEMES = ('Aventure', 'Amitié', 'Nature', 'Courage', 'Famille', 'Magie')
+CHARACTER_TYPES = ('Animaux', 'Humains', 'Fantastiques')
+AGE_RANGES = ('3-5 ans', '6-8 ans', '9-12 ans')
+
+SKELETON_POOL_SIZE = int(os.environ.get('SKELETON_POOL_SIZE', 3))
+# Un squelette est retiré après N utilisations pour garder de la variété
+SKELETON_MAX_USES = int(os.environ.get('SKELETON_MAX_USES', 20))
+SKELETON_TOP_UP_INTERVAL = int(os.environ.get('SKELETON_TOP_UP_INTERVAL', 900))
+SKELETON_TOP_UP_BATCH = int(os.environ.get('SKELETON_TOP_UP_BATCH', 10))
+
+CLOSING_SENTENCE = f"{NAME_MARKER} avait appris une belle leçon : {MORAL_MARKER}."
+
+
+def build_skeleton_prompt(theme, character_type, age_range):
+    return f"""Créez une histoire magique pour enfants avec ces paramètres :
+        - Nom de l'enfant : {NAME_MARKER} (écrivez exactement {NAME_MARKER} à chaque fois que le prénom apparaît)
+        - Thème : {theme}
+        - Type de personnage : {character_type}
+        - Tranche d'âge : {age_range}
+
+        L'histoire doit être adaptée à l'âge, captivante, éducative et se terminer positivement.
+        Terminez l'histoire par cette phrase exacte : « {CLOSING_SENTENCE} »
+        Longueur : environ 300-500 mots."""
+
+
+def fill_skeleton(content, child_name, moral):
+    moral = ' '.join(moral.split()).rstrip('.!')
+    return content.replace(NAME_MARKER, child_name.strip()).replace(MORAL_MARKER, moral)
+
+
+def take_skeleton(theme, character_type, age_range):
+    """Retourne le texte d'un squelette disponible pour la combinaison, ou None"""
+    with db.transaction(immediate=True) as conn:
+        row = conn.execute('''SELECT id, content FROM story_skeletons
+                              WHERE theme = ? AND character_type = ? AND age_range = ?
+                              ORDER BY used_count, RANDOM() LIMIT 1''',
+                           (theme, character_type, age_range)).fetchone()
+        if not row:
+            return None
+        conn.execute('UPDATE story_skeletons SET used_count = used_count + 1 WHERE id = ?', (row[0],))
+        conn.execute('DELETE FROM story_skeletons WHERE id = ? AND used_count >= ?', (row[0], SKELETON_MAX_USES))
+    return row[1]
+
+
+def instant_story(child_name, theme, character_type, moral, age_range):
+    content = take_skeleton(theme, character_type, age_range)
+    if content is None:
+        return None
+    return fill_skeleton(content, child_name, moral)
+
+
+def generate_skeleton(theme, character_type, age_range):
+    content = llm_client.complete(build_skeleton_prompt(theme, character_type, age_range))
+    if NAME_MARKER not in content:
+        raise ValueError('Marqueur du prénom absent de la réponse')
+    if MORAL_MARKER not in content:
+        content = content.rstrip() + '\n\n' + CLOSING_SENTENCE
+    db.execute('''INSERT INTO story_skeletons (theme, character_type, age_range, content, model)
+                  VALUES (?, ?, ?, ?, ?)''', (theme, character_type, age_range, content, llm_client.OPENAI_MODEL))
+
+
+def missing_skeletons():
+    """Combinaisons dont le stock est sous SKELETON_POOL_SIZE, les plus vides d'abord"""
+    counts = {(row[0], row[1], row[2]): row[3] for row in db.query_all(
+        '''SELECT theme, character_type, age_range, COUNT(*) FROM story_skeletons
+           GROUP BY theme, character_type, age_range''')}
+    missing = []
+    for theme in THEMES:
+        for character_type in CHARACTER_TYPES:
+            for age_range in AGE_RANGES:
+                count = counts.get((theme, character_type, age_range), 0)
+                if count < SKELETON_POOL_SIZE:
+                    missing.append((count, theme, character_type, age_range))
+    return [combo[1:] for combo in sorted(missing)]
+
+
+def top_up_skeletons(max_new=SKELETON_TOP_UP_BATCH):
+    """Complète le stock ; s'arrête à la première erreur (quota, réseau), ou dès que le plafond
+    LLM_MAX_IN_FLIGHT est atteint : les histoires demandées passent avant le stock"""
+    if not os.environ.get('OPENAI_API_KEY'):
+        return 0
+    created = 0
+    for theme, character_type, age_range in missing_skeletons()[:max_new]:
+        with db.get_connection() as conn:
+            if not admission.llm_slot_available(conn):
+                logger.info('Plafond d\'appels IA atteint, réapprovisionnement des squelettes reporté')
+                break
+        try:
+            generate_skeleton(theme, character_type, age_range)
+            created += 1
+        except Exception as e:
+            logger.warning('Squelette %s/%s/%s non généré : %s', theme, character_type, age_range, e)
+            break
+    return created
+
+
+if __name__ == '__main__':
+    from app_final_complet import init_db
+
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    batch = int(sys.argv[1]) if len(sys.argv) > 1 else len(THEMES) * len(CHARACTER_TYPES) * len(AGE_RANGES)
+    total = 0
+    while True:
+        created = top_up_skeletons(batch)
+        total += created
+        if not created or not missing_skeletons():
+            break
+    print(f'{total} squelette(s) créé(s)')
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des textes d'histoires générés pour Histoires Magiques
+La clé est le hash des paramètres du formulaire normalisés, du modèle et
+de la température : un formulaire identique ne refait pas d'appel IA.
+Deux niveaux : LRU en mémoire du processus, puis table SQLite partagée.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import db
+
+STORY_CACHE_TTL = int(os.environ.get('STORY_CACHE_TTL', 7 * 24 * 3600))
+STORY_CACHE_MEMORY_SIZE = int(os.environ.get('STORY_CACHE_MEMORY_SIZE', 256))
+STORY_CACHE_MAX_ROWS = int(os.environ.get('STORY_CACHE_MAX_ROWS', 5000))
+# Le nettoyage de la table n'est lancé qu'une écriture sur N
+PRUNE_EVERY = 50
+
+_stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'writes': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+class LRUCache:
+    """Dictionnaire borné avec expiration, sûr entre threads"""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_memory = LRUCache(STORY_CACHE_MEMORY_SIZE, STORY_CACHE_TTL)
+_writes = 0
+
+
+def _normalize(value, casefold=True):
+    value = ' '.join(str(value or '').split())
+    return value.casefold() if casefold else value
+
+
+def make_key(child_name, theme, character_type, moral, age_range, model, temperature):
+    # Le prénom garde sa casse : il est recopié tel quel dans l'histoire
+    payload = {
+        'child_name': _normalize(child_name, casefold=False),
+        'theme': _normalize(theme),
+        'character_type': _normalize(character_type),
+        'moral': _normalize(moral).rstrip('.!'),
+        'age_range': _normalize(age_range),
+        'model': model,
+        'temperature': temperature
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get(key):
+    content = _memory.get(key)
+    if content is not None:
+        _count('memory_hits')
+        return content
+
+    now = time.time()
+    row = db.query_one('SELECT content FROM story_cache WHERE key = ? AND created_at > ?',
+                       (key, now - STORY_CACHE_TTL))
+    if not row:
+        _count('misses')
+        return None
+    db.execute('UPDATE story_cache SET hits = hits + 1, last_used = ? WHERE key = ?', (now, key))
+    _memory.put(key, row[0])
+    _count('db_hits')
+    return row[0]
+
+
+def put(key, content, model):
+    global _writes
+    now = time.time()
+    db.execute('''INSERT OR REPLACE INTO story_cache (key, content, model, created_at, last_used, hits)
+                  VALUES (?, ?, ?, ?, ?, 0)''', (key, content, model, now, now))
+    _memory.put(key, content)
+    _count('writes')
+    _writes += 1
+    if _writes % PRUNE_EVERY == 0:
+        prune()
+
+
+def prune():
+    """Supprime les entrées expirées puis les moins utilisées au-delà de la taille maximale"""
+    now = time.time()
+    with db.transaction() as conn:
+        conn.execute('DELETE FROM story_cache WHERE created_at <= ?', (now - STORY_CACHE_TTL,))
+        conn.execute('''DELETE FROM story_cache WHERE key IN (
+                            SELECT key FROM story_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)''',
+                     (STORY_CACHE_MAX_ROWS,))
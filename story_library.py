@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Bibliothèque d'histoires de l'utilisateur pour Histoires Magiques
+Liste paginée par curseur (created_at, id) sur l'index (user_id, created_at) :
+chaque page coûte le même prix quelle que soit sa profondeur, et seules les
+colonnes affichées sont lues (jamais le texte complet de l'histoire).
+Le nombre total d'histoires est tenu à jour dans users.story_count par des
+triggers SQLite (créés par migrations.py).
+"""
+
+import base64
+import binascii
+import os
+
+import db
+from models import STORY_LIST, Story
+
+STORY_PAGE_SIZE = int(os.environ.get('STORY_PAGE_SIZE', 10))
+MAX_PAGE_SIZE = 50
+
+def encode_cursor(created_at, story_id):
+    raw = f'{created_at}|{story_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Retourne (created_at, id) ; ValueError si le curseur est invalide"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, story_id = raw.rsplit('|', 1)
+        return created_at, int(story_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Curseur invalide')
+
+
+def list_stories(user_id, cursor=None, limit=STORY_PAGE_SIZE):
+    """Une page d'histoires, les plus récentes d'abord, et le curseur de la page suivante (ou None)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    if cursor:
+        created_at, story_id = decode_cursor(cursor)
+        rows = db.query_all(f'''SELECT {STORY_LIST} FROM stories
+                                WHERE user_id = ? AND (created_at, id) < (?, ?)
+                                ORDER BY created_at DESC, id DESC LIMIT ?''',
+                            (user_id, created_at, story_id, limit + 1), row_factory=Story.row_factory)
+    else:
+        rows = db.query_all(f'''SELECT {STORY_LIST} FROM stories WHERE user_id = ?
+                                ORDER BY created_at DESC, id DESC LIMIT ?''',
+                            (user_id, limit + 1), row_factory=Story.row_factory)
+
+    # Une ligne de plus que demandé indique qu'il reste une page
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
+
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des synthèses vocales pour Histoires Magiques
+La clé est le hash du texte normalisé, de la voix, du modèle et des réglages
+de voix : un même passage (histoire régénérée, texte du cache d'histoires,
+histoire de secours) n'est synthétisé qu'une fois, quel que soit le compte.
+Les MP3 sont gardés sur disque (DiskLRUCache), les moins récemment utilisés
+sont évincés au-delà de TTS_CACHE_MAX_MB.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+
+import tts_client
+from disk_cache import DiskLRUCache
+
+TTS_CACHE_DIR = os.environ.get('TTS_CACHE_DIR', '.tts_cache')
+TTS_CACHE_MAX_MB = int(os.environ.get('TTS_CACHE_MAX_MB', 300))
+
+_cache = None
+_cache_lock = threading.Lock()
+# Un seul appel ElevenLabs par clé à la fois dans le processus : {clé: [verrou, threads]}
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskLRUCache(TTS_CACHE_DIR, TTS_CACHE_MAX_MB * 1024 * 1024, ext='.mp3',
+                                  metrics_prefix='tts_cache.')
+        return _cache
+
+
+def get_stats():
+    """Compteurs de tous les processus : une recherche = un hit ou un miss"""
+    return get_cache().get_stats()
+
+
+def normalize_text(text):
+    """Texte envoyé à la synthèse : NFC, espaces et sauts de ligne réguliers"""
+    text = unicodedata.normalize('NFC', text or '').replace('\r\n', '\n')
+    text = re.sub(r'[ \t\u00a0\u202f]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+def cache_key(text, voice_id, model_id, voice_settings):
+    payload = json.dumps([text, voice_id, model_id, voice_settings or tts_client.DEFAULT_VOICE_SETTINGS],
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def synthesize_file(text, voice_id=tts_client.DEFAULT_VOICE_ID, model_id=tts_client.DEFAULT_MODEL_ID,
+                    voice_settings=None):
+    """MP3 du passage ouvert en lecture (à fermer par l'appelant) : depuis le cache, sinon
+    synthétisé directement dans le cache, sans passer en entier par la mémoire"""
+    text = normalize_text(text)
+    key = cache_key(text, voice_id, model_id, voice_settings)
+    cache = get_cache()
+    f = cache.open_file(key)
+    if f is not None:
+        return f
+
+    # Entrée [verrou, nombre de threads intéressés] : retirée par le dernier sorti,
+    # un thread arrivé pendant l'appel attend donc toujours le même verrou
+    with _pending_lock:
+        entry = _pending.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            # Peut-être synthétisé par un autre thread pendant l'attente (miss déjà compté)
+            f = cache.open_file(key, count=False)
+            if f is not None:
+                return f
+            path = cache.write_file(key, lambda out: tts_client.synthesize(
+                text, out, voice_id=voice_id, model_id=model_id, voice_settings=voice_settings))
+            # Entrée la plus récente : la dernière à être évincée
+            return open(path, 'rb')
+    finally:
+        with _pending_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _pending[key]
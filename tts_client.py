@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Client ElevenLabs (synthèse vocale) pour Histoires Magiques
+Session HTTP partagée (keep-alive), délais de connexion/lecture, reprises
+avec gigue ; chaque appel synthétise un passage (voir audio_pipeline.py).
+L'URL de base est configurable pour tester contre un serveur local.
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger('histoires.tts')
+
+ELEVENLABS_BASE_URL = os.environ.get('ELEVENLABS_BASE_URL', 'https://api.elevenlabs.io')
+TTS_CONNECT_TIMEOUT = float(os.environ.get('TTS_CONNECT_TIMEOUT', 3.05))
+TTS_READ_TIMEOUT = float(os.environ.get('TTS_READ_TIMEOUT', 60))
+TTS_POOL_SIZE = int(os.environ.get('TTS_POOL_SIZE', 10))
+TTS_MAX_RETRIES = int(os.environ.get('TTS_MAX_RETRIES', 3))
+
+DEFAULT_VOICE_ID = '21m00Tcm4TlvDq8ikWAM'
+DEFAULT_MODEL_ID = 'eleven_monolingual_v1'
+DEFAULT_VOICE_SETTINGS = {
+    "stability": 0.5,
+    "similarity_boost": 0.5
+}
+
+CHUNK_SIZE = 64 * 1024
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+
+class TTSError(Exception):
+    pass
+
+
+class _RetryableResponse(Exception):
+    pass
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Session du processus courant : connexions TLS réutilisées d'une histoire à l'autre"""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _session_lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=TTS_POOL_SIZE, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+def _backoff(attempt):
+    # « Full jitter » : évite que les workers relancent tous en même temps
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+def synthesize(text, out, voice_id=DEFAULT_VOICE_ID, model_id=DEFAULT_MODEL_ID, voice_settings=None):
+    """Synthétise un passage et écrit le MP3 dans le fichier binaire out au fil de la réception
+    (jamais en entier en mémoire) ; un échec passager vide out et relance tout le passage"""
+    url = f"{ELEVENLABS_BASE_URL}/v1/text-to-speech/{voice_id}"
+    headers = {
+        "Accept": "audio/mpeg",
+        "Content-Type": "application/json",
+        "xi-api-key": os.environ.get('ELEVENLABS_API_KEY', '')
+    }
+    data = {
+        "text": text,
+        "model_id": model_id,
+        "voice_settings": voice_settings or DEFAULT_VOICE_SETTINGS
+    }
+
+    attempt = 0
+    while True:
+        try:
+            out.seek(0)
+            out.truncate()
+            with get_session().post(url, json=data, headers=headers, stream=True,
+                                    timeout=(TTS_CONNECT_TIMEOUT, TTS_READ_TIMEOUT)) as response:
+                if response.status_code in RETRYABLE_STATUS:
+                    raise _RetryableResponse(f'HTTP {response.status_code}')
+                if response.status_code != 200:
+                    raise TTSError(f'HTTP {response.status_code} : {response.text[:200]}')
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    out.write(chunk)
+                return
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                _RetryableResponse) as e:
+            if attempt >= TTS_MAX_RETRIES:
+                raise TTSError(f'Synthèse abandonnée après {attempt + 1} essais : {e}')
+            delay = _backoff(attempt)
+            logger.info('Synthèse en échec (%s), nouvel essai dans %.1fs', e, delay)
+            time.sleep(delay)
+            attempt += 1
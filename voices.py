@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Catalogue des voix de narration pour Histoires Magiques
+La liste des voix ElevenLabs est relue au plus toutes les VOICE_CATALOG_TTL
+secondes, toujours hors des requêtes : par worker.py au démarrage, ou par un
+thread de fond pendant que l'ancienne liste reste servie. La dernière liste
+est partagée entre processus (VOICE_CATALOG_PATH). Sans clé API, un
+catalogue local fixe est utilisé.
+Chaque voix a un extrait pré-enregistré dans static/voices : le sélecteur
+de create_story et ses écoutes n'appellent jamais la synthèse en direct.
+
+Pré-enregistrement des extraits : python voices.py (aussi lancé en tâche de fond par worker.py)
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+import requests
+
+import tts_cache
+import tts_client
+
+logger = logging.getLogger('histoires.voices')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLES_DIR = os.path.join(BASE_DIR, 'static', 'voices')
+
+VOICE_CATALOG_TTL = int(os.environ.get('VOICE_CATALOG_TTL', 24 * 3600))
+# Nouvel essai après un échec de l'API (l'ancienne liste est gardée entre-temps)
+VOICE_CATALOG_RETRY = 300
+VOICE_CATALOG_TIMEOUT = float(os.environ.get('VOICE_CATALOG_TIMEOUT', 5))
+VOICE_CATALOG_PATH = os.environ.get('VOICE_CATALOG_PATH', '.voice_catalog.json')
+# Liste blanche facultative d'identifiants séparés par des virgules
+VOICE_IDS = [voice_id.strip() for voice_id in os.environ.get('VOICE_IDS', '').split(',') if voice_id.strip()]
+
+# Seuls les abonnements proposent le choix de la voix (voir la page d'abonnement)
+VOICE_CHOICE_PLANS = ('starter', 'family')
+
+SAMPLE_TEXT = ("Il était une fois, au bord d'une forêt enchantée, une petite étoile "
+               "qui rêvait d'entendre de belles histoires.")
+
+# Voix prédéfinies d'ElevenLabs : catalogue sans clé API (développement, tests)
+STUB_VOICES = [
+    {'voice_id': tts_client.DEFAULT_VOICE_ID, 'name': 'Rachel', 'description': 'Féminine, douce'},
+    {'voice_id': 'EXAVITQu4vr4xnSDxMaL', 'name': 'Bella', 'description': 'Féminine, chaleureuse'},
+    {'voice_id': 'ErXwobaYiN019PkySvjV', 'name': 'Antoni', 'description': 'Masculine, posée'},
+    {'voice_id': 'TxGEqnHWrfWFTfGW9XjX', 'name': 'Josh', 'description': 'Masculine, grave'},
+]
+
+VOICE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+_catalog = None
+# Date du prochain rafraîchissement (après VOICE_CATALOG_TTL, ou VOICE_CATALOG_RETRY après un échec)
+_next_refresh = 0
+_refreshing = False
+_catalog_lock = threading.Lock()
+
+
+def _fetch_voices():
+    # Délai de lecture court et dédié : la liste n'est jamais attendue par une page
+    response = tts_client.get_session().get(
+        f'{tts_client.ELEVENLABS_BASE_URL}/v1/voices',
+        headers={'xi-api-key': os.environ.get('ELEVENLABS_API_KEY', '')},
+        timeout=(tts_client.TTS_CONNECT_TIMEOUT, VOICE_CATALOG_TIMEOUT))
+    response.raise_for_status()
+    voices = []
+    for item in response.json().get('voices', []):
+        voice_id = item.get('voice_id', '')
+        if not VOICE_ID_PATTERN.match(voice_id) or (VOICE_IDS and voice_id not in VOICE_IDS):
+            continue
+        labels = item.get('labels') or {}
+        description = labels.get('description') or ', '.join(
+            value for value in (labels.get('gender'), labels.get('accent'), labels.get('age')) if value)
+        voices.append({'voice_id': voice_id, 'name': item.get('name') or voice_id, 'description': description})
+    # La voix par défaut en tête si le compte la propose
+    voices.sort(key=lambda voice: voice['voice_id'] != tts_client.DEFAULT_VOICE_ID)
+    return voices
+
+
+def _load_saved():
+    """Dernière liste enregistrée par un processus (worker ou web), avec sa date"""
+    try:
+        with open(VOICE_CATALOG_PATH) as f:
+            voices = json.load(f)
+        return voices, os.path.getmtime(VOICE_CATALOG_PATH)
+    except (OSError, ValueError):
+        return None, 0
+
+
+def refresh_catalog():
+    """Relit la liste auprès de l'API (appel HTTP hors verrou) ; retourne la liste ou None en cas d'échec"""
+    global _catalog, _next_refresh
+    try:
+        voices = _fetch_voices()
+        if not voices:
+            raise ValueError('catalogue vide')
+    except (requests.RequestException, ValueError) as e:
+        logger.warning('Catalogue des voix indisponible : %s', e)
+        with _catalog_lock:
+            _next_refresh = time.time() + VOICE_CATALOG_RETRY
+        return None
+    with _catalog_lock:
+        _catalog, _next_refresh = voices, time.time() + VOICE_CATALOG_TTL
+    # Copie partagée : les autres processus démarrent avec cette liste
+    tmp_path = f'{VOICE_CATALOG_PATH}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(voices, f)
+        os.replace(tmp_path, VOICE_CATALOG_PATH)
+    except OSError:
+        logger.warning('Catalogue des voix non enregistré', exc_info=True)
+    return voices
+
+
+def _refresh_in_background():
+    global _refreshing
+    try:
+        refresh_catalog()
+    finally:
+        with _catalog_lock:
+            _refreshing = False
+
+
+def get_catalog():
+    """Voix disponibles (liste de dicts voice_id, name, description), sans jamais attendre l'API :
+    la liste périmée reste servie pendant qu'un thread la rafraîchit"""
+    global _catalog, _next_refresh, _refreshing
+    if not os.environ.get('ELEVENLABS_API_KEY'):
+        return STUB_VOICES
+    with _catalog_lock:
+        if _catalog is None:
+            saved, saved_at = _load_saved()
+            if saved:
+                _catalog, _next_refresh = saved, max(_next_refresh, saved_at + VOICE_CATALOG_TTL)
+        if time.time() >= _next_refresh and not _refreshing:
+            _refreshing = True
+            threading.Thread(target=_refresh_in_background, name='voice-catalog', daemon=True).start()
+        return _catalog or STUB_VOICES
+
+
+def sample_path(voice_id):
+    return os.path.join(SAMPLES_DIR, f'{voice_id}.mp3')
+
+
+def get_voices():
+    """Catalogue pour le sélecteur : chaque voix avec son extrait statique (ou None s'il n'est pas prêt)"""
+    return [dict(voice, sample=f'voices/{voice["voice_id"]}.mp3'
+                 if os.path.exists(sample_path(voice['voice_id'])) else None)
+            for voice in get_catalog()]
+
+
+def can_choose(plan):
+    return plan in VOICE_CHOICE_PLANS
+
+
+def resolve_voice(voice_id, plan):
+    """Voix utilisable pour ce plan : celle demandée si elle est au catalogue, sinon la voix par défaut"""
+    if can_choose(plan) and voice_id and any(voice['voice_id'] == voice_id for voice in get_catalog()):
+        return voice_id
+    return tts_client.DEFAULT_VOICE_ID
+
+
+def warm_samples():
+    """Enregistre l'extrait des voix qui n'en ont pas encore ; retourne le nombre d'extraits créés"""
+    if not os.environ.get('ELEVENLABS_API_KEY'):
+        return 0
+    os.makedirs(SAMPLES_DIR, exist_ok=True)
+    created = 0
+    # Hors requête : la liste est relue ici, à jour pour tous les processus
+    for voice in refresh_catalog() or get_catalog():
+        path = sample_path(voice['voice_id'])
+        if os.path.exists(path):
+            continue
+        try:
+            audio = tts_cache.synthesize_file(SAMPLE_TEXT, voice_id=voice['voice_id'])
+        except tts_client.TTSError as e:
+            logger.warning('Extrait de la voix %s non créé : %s', voice['voice_id'], e)
+            continue
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with audio, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(audio, f)
+        os.replace(tmp_path, path)
+        created += 1
+    return created
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    count = warm_samples()
+    print(f'{count} extrait(s) créé(s) pour {len(get_catalog())} voix')
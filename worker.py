@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Processus de génération d'histoires pour Histoires Magiques
+Un pool de threads consomme la table jobs : texte IA puis audio dans la voix choisie
+(le PDF est rendu au premier téléchargement, voir pdf_renderer.py).
+Lancement : python worker.py (ou automatiquement via gunicorn.conf.py)
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+
+import credits
+import db
+import jobs
+import orchestrator
+import skeletons
+import voices
+
+logger = logging.getLogger('histoires.worker')
+
+WORKER_CONCURRENCY = int(os.environ.get('WORKER_CONCURRENCY', 4))
+POLL_INTERVAL = float(os.environ.get('WORKER_POLL_INTERVAL', 0.5))
+
+_stop = threading.Event()
+
+
+def update_story(story_id, column, value):
+    db.execute(f'UPDATE stories SET {column} = ? WHERE id = ?', (value, story_id))
+
+
+def process_job(job):
+    # Import tardif : le module de l'app n'est chargé que dans le worker
+    from app_final_complet import generate_story_with_ai, generate_audio_with_elevenlabs, fallback_story
+
+    params = json.loads(job['params'])
+    story_id = job['story_id']
+    timings = json.loads(job['timings'] or '{}')
+
+    if job['text_status'] != 'done':
+        jobs.update_stage(job['id'], 'text', 'running')
+        started = time.monotonic()
+        story_content = generate_story_with_ai(params['child_name'], params['theme'],
+                                               params['character_type'], params['moral'],
+                                               params['age_range'],
+                                               new_variant=params.get('new_variant', False))
+        timings['text'] = round(time.monotonic() - started, 3)
+        update_story(story_id, 'content', story_content)
+        jobs.update_stage(job['id'], 'text', 'done')
+    else:
+        story_content = db.query_one('SELECT content FROM stories WHERE id = ?', (story_id,))[0]
+
+    # L'audio ne dépend que du texte ; son délai maximum est géré par l'orchestrateur
+    stages = {}
+    if job['audio_status'] not in ('done', 'unavailable'):
+        stages['audio'] = lambda: generate_audio_with_elevenlabs(
+            story_content, voice_id=params.get('voice_id'),
+            on_preview=lambda key: jobs.set_audio_preview(job['id'], key))
+    for stage in stages:
+        jobs.update_stage(job['id'], stage, 'running')
+
+    started = time.monotonic()
+    results = orchestrator.run_stages(stages)
+    if results:
+        timings['artifacts'] = round(time.monotonic() - started, 3)
+    for stage, result in results.items():
+        timings[stage] = round(result['duration'], 3)
+        if result['status'] != 'done':
+            logger.warning('Étape %s du travail %s : %s', stage, job['id'], result['error'])
+
+    # L'histoire est conservée même si l'audio échoue ou dépasse son délai
+    audio = results.get('audio')
+    if audio and audio['status'] == 'done' and audio['value']:
+        # Le MP3 est déjà écrit en flux dans le store : la valeur est sa clé
+        update_story(story_id, 'audio_file', audio['value'])
+        jobs.update_stage(job['id'], 'audio', 'done')
+    elif audio:
+        jobs.update_stage(job['id'], 'audio', 'unavailable')
+
+    jobs.record_timings(job['id'], timings)
+    jobs.finish_job(job['id'])
+    # Texte de secours seulement (IA et squelettes indisponibles) : l'histoire n'est pas facturée
+    if story_content == fallback_story(params['child_name']):
+        credits.refund(story_id)
+    else:
+        credits.commit(story_id)
+    return timings
+
+
+def worker_loop():
+    while not _stop.is_set():
+        job = jobs.claim_next_job()
+        if not job:
+            _stop.wait(POLL_INTERVAL)
+            continue
+        started = time.monotonic()
+        try:
+            timings = process_job(job)
+            logger.info('Travail %s terminé en %.1fs %s', job['id'], time.monotonic() - started, timings)
+        except Exception as e:
+            logger.exception('Échec du travail %s', job['id'])
+            if jobs.fail_job(job['id'], job['attempts'] + 1, str(e)):
+                credits.refund(job['story_id'])
+
+
+def skeleton_loop():
+    # Réapprovisionne les squelettes d'histoires instantanées en tâche de fond,
+    # dès le démarrage (stock vide après un déploiement) puis à intervalle régulier
+    while not _stop.is_set():
+        try:
+            created = skeletons.top_up_skeletons()
+            if created:
+                logger.info('%s squelette(s) d\'histoire ajouté(s)', created)
+        except Exception:
+            logger.exception('Échec du réapprovisionnement des squelettes')
+        _stop.wait(skeletons.SKELETON_TOP_UP_INTERVAL)
+
+
+def stale_streams_loop():
+    # Flux SSE abandonnés (processus web tué en cours de génération) : rendus au worker
+    # dès l'expiration de leur bail, sans attendre un redémarrage
+    while not _stop.wait(jobs.STREAM_LEASE / 4):
+        try:
+            requeued = jobs.requeue_stale_streams()
+            if requeued:
+                logger.info('%s flux abandonné(s) remis en file', requeued)
+        except Exception:
+            logger.exception('Échec de la reprise des flux abandonnés')
+
+
+def voice_samples():
+    # Extraits des voix du sélecteur, enregistrés une fois (voir voices.py)
+    try:
+        created = voices.warm_samples()
+        if created:
+            logger.info('%s extrait(s) de voix enregistré(s)', created)
+    except Exception:
+        logger.exception('Échec de l\'enregistrement des extraits de voix')
+
+
+def main():
+    from app_final_complet import init_db
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(name)s %(levelname)s %(message)s')
+    init_db()
+    requeued = jobs.requeue_stale_jobs()
+    if requeued:
+        logger.info('%s travail(aux) interrompu(s) remis en file', requeued)
+
+    signal.signal(signal.SIGTERM, lambda *args: _stop.set())
+    signal.signal(signal.SIGINT, lambda *args: _stop.set())
+
+    threads = [threading.Thread(target=worker_loop, name=f'story-worker-{i}', daemon=True)
+               for i in range(WORKER_CONCURRENCY)]
+    threads.append(threading.Thread(target=skeleton_loop, name='skeleton-top-up', daemon=True))
+    threads.append(threading.Thread(target=stale_streams_loop, name='stale-streams', daemon=True))
+    threads.append(threading.Thread(target=voice_samples, name='voice-samples', daemon=True))
+    for thread in threads:
+        thread.start()
+    logger.info('Worker démarré avec %s threads', WORKER_CONCURRENCY)
+
+    while not _stop.is_set():
+        _stop.wait(1)
+    for thread in threads:
+        thread.join(timeout=30)
+
+
+if __name__ == '__main__':
+    main()